@@ -0,0 +1,237 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Benchmark of the simulation throughput. The model is run over a
+             matrix of grid sizes, initial populations and wolf territoria
+             with fixed seeds. For every configuration the construction time,
+             the steps per second, the profile of the model (time spent in the
+             step() of every breed and the phases of the model step, and the
+             grid operations) and the peak memory are measured. Separately,
+             the memory per agent and the speed of attribute access are
+             measured for every agent class. The results are written to a
+             JSON-file, so runs can be compared across commits.
+
+             Run this file using:
+             python3 benchmark.py --output benchmark_results.json
+"""
+from itertools import product
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+import timeit
+import tracemalloc
+
+from wolf_elk.agents import Elk, GrassPatch
+from wolf_elk.model import WolfElk
+from wolf_elk.wolf import Wolf, Pack
+
+GRID_SIZES = (40, 100)
+# Pairs of (initial_elk, initial_wolves)
+POPULATIONS = ((200, 20), (2000, 200))
+TERRITORIA = (2, 8)
+SEEDS = (0, 1)
+
+# Agents created per class to measure the memory per agent.
+AGENT_SAMPLE = 10000
+
+
+def benchmark(params, steps, seed):
+    """
+    Benchmarks a single configuration.
+    Args:
+        params (dict): Keyword arguments for WolfElk.
+        steps   (int): The amount of steps to run.
+        seed    (int): The seed of the run.
+    Returns:
+        Dictionary with the measurements.
+    """
+    start = time.perf_counter()
+    model = WolfElk(**params, seed=seed)
+    construction_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.step()
+    run_time = time.perf_counter() - start
+
+    # The time per breed, phase and grid operation is measured in a separate
+    # run with the profiler of the model.
+    model = WolfElk(**params, seed=seed, profile=True)
+    for _ in range(steps):
+        model.step()
+    profile = model.get_profile_dataframe()
+    profile = profile[profile['step'] > 0].groupby(['kind', 'name']).sum()
+
+    # Memory is measured in a separate run, tracing slows the model down.
+    tracemalloc.start()
+    model = WolfElk(**params, seed=seed)
+    for _ in range(steps):
+        model.step()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "params": params,
+        "seed": seed,
+        "steps": steps,
+        "construction_time": construction_time,
+        "run_time": run_time,
+        "steps_per_second": steps / run_time,
+        "breed_step_time": profile_totals(profile, 'breed', 'seconds'),
+        "breed_step_calls": profile_totals(profile, 'breed', 'calls'),
+        "phase_time": profile_totals(profile, 'phase', 'seconds'),
+        "grid_operation_calls": profile_totals(profile, 'grid', 'calls'),
+        "peak_memory_bytes": peak_memory
+    }
+
+
+def profile_totals(profile, kind, column):
+    """
+    Returns per name the total of a column of one kind of profile records.
+    """
+    if kind not in profile.index.get_level_values('kind'):
+        return {}
+    return profile.loc[kind, column].to_dict()
+
+
+def agent_factories(model):
+    """
+    Returns per agent class a function which creates an agent at (0, 0) and
+    the attribute which is read in the access benchmark.
+    """
+    return {
+        "Elk": (lambda i: Elk(i, (0, 0), model, True, 1.0, 4.0), "age"),
+        "Wolf": (lambda i: Wolf(i, (0, 0), model, True, 4.0), "energy"),
+        "Pack": (lambda i: Pack(i, (0, 0), model, [], True, 2), "wolves"),
+        "GrassPatch": (
+            lambda i: GrassPatch(i, (0, 0), model, True, 0), "countdown"
+        )
+    }
+
+
+def benchmark_agents(number=AGENT_SAMPLE):
+    """
+    Measures the memory per agent and the time of an attribute read and
+    write for every agent class. Agents are created outside the grid and
+    the scheduler, so only the agent objects themselves are measured.
+    Args:
+        number (int): The amount of agents to create per class.
+    Returns:
+        Dictionary with per class name the measurements.
+    """
+    model = WolfElk(initial_elk=0, initial_wolves=0, seed=0)
+    results = {}
+    for name, (create, attribute) in agent_factories(model).items():
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        agents = [create(i) for i in range(number)]
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        agent = agents[0]
+        namespace = {"agent": agent}
+        read = timeit.Timer(
+            "agent.{}".format(attribute), globals=namespace
+        ).autorange()
+        write = timeit.Timer(
+            "agent.pos = pos", setup="pos = agent.pos", globals=namespace
+        ).autorange()
+        results[name] = {
+            "bytes_per_agent": (after - before) / number,
+            "has_dict": hasattr(agent, "__dict__"),
+            "attribute_read_ns": read[1] / read[0] * 1e9,
+            "attribute_write_ns": write[1] / write[0] * 1e9
+        }
+        del agents
+    return results
+
+
+def configurations(grass_engine, elk_engine):
+    """
+    Returns the keyword arguments for WolfElk of every benchmark
+    configuration.
+    """
+    for size, (elk, wolves), territorium in product(
+        GRID_SIZES, POPULATIONS, TERRITORIA
+    ):
+        yield {
+            "height": size,
+            "width": size,
+            "initial_elk": elk,
+            "initial_wolves": wolves,
+            "wolf_territorium": territorium,
+            "grass_engine": grass_engine,
+            "elk_engine": elk_engine
+        }
+
+
+def git_commit():
+    """
+    Returns the hash of the current commit, or None outside a repository.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the simulation throughput of WolfElk.'
+    )
+    parser.add_argument('--steps', type=int, default=50,
+                        help='Steps to run per configuration.')
+    parser.add_argument('--grass-engine', default='agents',
+                        choices=['agents', 'array'])
+    parser.add_argument('--elk-engine', default='agents',
+                        choices=['agents', 'array'],
+                        help="The 'array' engine needs --grass-engine array.")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON-file to write the results to.')
+    args = parser.parse_args()
+
+    agent_results = benchmark_agents()
+    for name, result in agent_results.items():
+        print(
+            "{}: {:.0f} bytes/agent, read {:.1f} ns, write {:.1f} ns".format(
+                name, result["bytes_per_agent"],
+                result["attribute_read_ns"], result["attribute_write_ns"]
+            )
+        )
+
+    results = []
+    for params in configurations(args.grass_engine, args.elk_engine):
+        for seed in SEEDS:
+            result = benchmark(params, args.steps, seed)
+            print(
+                "{}: {:.1f} steps/s, construction {:.3f} s, peak {:.1f} MB"
+                .format(
+                    params, result["steps_per_second"],
+                    result["construction_time"],
+                    result["peak_memory_bytes"] / 2**20
+                )
+            )
+            results.append(result)
+
+    with open(args.output, 'w') as output:
+        json.dump(
+            {
+                "commit": git_commit(),
+                "date": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "agents": agent_results,
+                "results": results
+            },
+            output,
+            indent=2
+        )
@@ -13,9 +13,14 @@ DESCRIPTION: This class is used to run the model multiple times and to save the
              part.
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import shutil
 import pandas as pd
 import numpy as np
 from wolf_elk.model import WolfElk
+from wolf_elk.store import ResultStore
+from wolf_elk.sweep import run_replicate
 from matplotlib import pyplot as plt
 
 
@@ -24,16 +29,56 @@ class Runner():
     Class to run the model given the amount of iterations and optional
     parameters.
     """
-    def __init__(self, params):
+    def __init__(self, params, seed=None, warm_start=None):
+        """
+        Args:
+            params (dict): Keyword arguments for WolfElk.
+            seed    (int, optional): Seed from which the seeds of the
+                                     replicates are derived.
+            warm_start (WarmStartCache, optional): Cache of burned-in states
+                                     the replicates start from. The steps
+                                     of the burn-in count towards the step
+                                     count, so the results start after it.
+        """
         self.params = params
+        self.seed = seed
+        self.warm_start = warm_start
 
-    def run(self, step_count, iterations=10):
-        df_list = []
+    def run(self, step_count, iterations=10, workers=1, sink=None):
+        """
+        Runs the replicates of the model.
+        Args:
+            step_count (int): The amount of steps per replicate.
+            iterations (int, optional): The amount of replicates.
+            workers    (int, optional): The amount of processes to run the
+                                        replicates in. The results are the
+                                        same as a serial run with the same
+                                        seed.
+            sink (ResultSink, optional): Sink to which every replicate
+                                         streams its results, with the
+                                         replicate number in the 'replicate'
+                                         column.
+        Returns:
+            Pandas Dataframe with the results of all replicates, in replicate
+            order, or the sink when one is given.
+        """
+        seeds = WolfElk.spawn_seeds(self.seed, iterations)
+        if sink is None:
+            sinks = repeat(None)
+        else:
+            sinks = (sink.for_replicate(i) for i in range(iterations))
+        args = (
+            repeat(self.params), repeat(step_count), seeds, sinks,
+            repeat(self.warm_start)
+        )
 
-        for _ in range(iterations):
-            model = WolfElk(**self.params)
-            result_df = model.run_model(step_count)
-            df_list.append(result_df)
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                df_list = list(executor.map(run_replicate, *args))
+        else:
+            df_list = list(map(run_replicate, *args))
+        if sink is not None:
+            return sink
         return pd.concat(df_list, ignore_index=True)
 
 
@@ -99,6 +144,17 @@ if __name__ == "__main__":
         'initial_wolves': 0
     }
     runner = Runner(parameters)
-    result_df = runner.run(step_count, iterations=2)
+    # The replicates stream their results to a binary result store while
+    # running, with the parameters in every row.
+    store_path = 'results_data/model_results'
+    shutil.rmtree(store_path, ignore_errors=True)
+    store = ResultStore(store_path, parameter_names=list(parameters))
+    runner.run(
+        step_count, iterations=2, workers=2, sink=store.sink(parameters)
+    )
+    result_df = store.read(
+        ['step', 'wolf', 'elk', 'pack', 'average_kills', 'average_elk_age']
+    )
     mean, std = get_statistics(result_df, step_count)
-    result_df.to_csv('model_results.csv')
+    # Also written as a csv-file, the format read by results.ipynb.
+    result_df.to_csv('results_data/model_results.csv')
@@ -11,25 +11,32 @@ DESCRIPTION: Class with SOBOL sensitivity analysis functions from SALib.
              analysis. There it is possible to define the variables to analyze,
              boundaries and which model reporters are to be used.
 
+             The SobolEngine runs the samples of an analysis in a process pool
+             and appends the finished runs to a ResultStore, so an interrupted
+             analysis continues where it stopped. The columns of the store
+             are loaded as memory maps for sobol.analyze.
+
              NOTE: Parameter run_analysis on line 184 should be set to True to
                    actually run the analysis. Otherwise only plots are made if
-                   the result.csv is present.
+                   the result store (or the result csv) is present.
 
              Run this file using:
              python3 sensitivity.py
 """
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from itertools import combinations
 import numpy as np
-import copy
+import os
 from mesa.batchrunner import BatchRunner
 from SALib.sample import saltelli
 from SALib.analyze import sobol
 import pandas as pd
 import sys
-from wolf_elk.agents import Elk
-from wolf_elk.wolf import Wolf, Pack
-from wolf_elk.model import WolfElk
+from wolf_elk.model import (
+    WolfElk, report_wolves, report_elks, report_elks_age, report_kills
+)
+from wolf_elk.store import ResultStore
 
 
 class SensitivityAnalysis():
@@ -58,7 +65,10 @@ class SensitivityAnalysis():
         self.max_steps = max_steps
         self.distinct_samples = distinct_samples
         self.count = 0
-        self.data_definition = None
+        # Columns of the analysis data: parameters, run and reporters.
+        self.data_definition = self.problems['names'] + [
+            'Run', 'Elks', 'Wolves', 'Killed Elks/Wolf', 'Elks age'
+        ]
         self.model_reporters = model_reporters
         self.batch = BatchRunner(
             WolfElk,
@@ -84,29 +94,38 @@ class SensitivityAnalysis():
             problems['num_vars'] += 1
         return problems
 
-    def run_analysis(self, distinct_samples: int):
+    def run_analysis(self, distinct_samples: int, store=None):
+        """
+        Runs all replicates of all Saltelli samples in this process.
+        Args:
+            distinct_samples (int): Amount of distinct samples.
+            store (ResultStore, optional): Store to which the records of the
+                                           runs are also appended.
+        Returns:
+            Pandas Dataframe with the results of all runs.
+        """
         param_values = saltelli.sample(self.problems, distinct_samples, False)
 
-        data = pd.DataFrame(
-            index=[1],  # concatenation is done later.
-            columns=self.problems['names']
-        )
-        data['Run'] = None
-        data['Elks'] = None
-        data['Wolves'] = None
-        data['Killed Elks/Wolf'] = None
-        data['Elks age'] = None
-        self.data_definition = data
-        results = []
-        for _ in range(replicates):
+        # One record per run, the dataframe is only built at the end.
+        records = []
+        for _ in range(self.replicates):
             for vals in param_values:
-                result = self.sensitivity_iteration(vals)
-                results.append(result)
-        return pd.concat(results, ignore_index=True)
+                records.append(self.sensitivity_iteration(vals))
+        if store is not None:
+            store.append(records)
+            store.compact(sort_by='Run')
+        return pd.DataFrame(records, columns=self.data_definition)
 
-    def sensitivity_iteration(self, vals):
+    def sample_parameters(self, vals):
+        """
+        Converts a Saltelli sample to model parameters.
+        Args:
+            vals (array): The sampled parameter values.
+        Returns:
+            List with the converted values and a dictionary with the parameter
+            names and their values.
+        """
         # Change parameters that should be integers
-        data = copy.deepcopy(self.data_definition)
         vals = list(vals)
         vals[1] = int(vals[1])  # Pack size
         vals[2] = int(vals[2])  # Energy threshold
@@ -117,20 +136,31 @@ class SensitivityAnalysis():
         variable_parameters = {}
         for name, val in zip(self.problems['names'], vals):
             variable_parameters[name] = val
+        return vals, variable_parameters
+
+    def sensitivity_iteration(self, vals):
+        """
+        Runs the model for a single sample.
+        Args:
+            vals (array): The sampled parameter values.
+        Returns:
+            Dictionary with the parameters, the run and the reporter values.
+        """
+        vals, variable_parameters = self.sample_parameters(vals)
         current_count = self.count
         self.batch.run_iteration(
             variable_parameters, tuple(vals), current_count
         )
-        iteration_data = \
-            self.batch.get_model_vars_dataframe().iloc[current_count]
-        iteration_data['Run'] = current_count
-        data.iloc[0, 0:len(self.problems['names'])] = vals
-        data.iloc[
-            0,
-            len(self.problems['names']):len(self.problems['names'])+len(vals)]\
-            = iteration_data
+        # Take the reporters of this run only. The BatchRunner also keeps the
+        # collected data of every run, drop it so it does not grow with the
+        # amount of runs.
+        model_key = tuple(vals) + (current_count,)
+        record = dict(variable_parameters)
+        record['Run'] = current_count
+        record.update(self.batch.model_vars.pop(model_key))
+        self.batch.datacollector_model_reporters.pop(model_key, None)
         self.count += 1
-        return data
+        return record
 
     def plot_index(self, s, params, i, title=''):
         """
@@ -172,6 +202,149 @@ class SensitivityAnalysis():
         plt.savefig("{}.pdf".format(title), dpi=90, bbox_inches='tight')
 
 
+class SobolEngine():
+    """
+    Runs the Saltelli samples of a SensitivityAnalysis in a process pool.
+    The finished runs are appended to a ResultStore. When the store already
+    holds runs, these are skipped, so an interrupted analysis can be resumed
+    by running it again with the same store.
+    """
+    def __init__(self, analysis, output_path, workers=None, seed=None,
+                 flush_every=64, model_params=None, warm_start=None):
+        """
+        Args:
+            analysis (SensitivityAnalysis): The analysis to run.
+            output_path (str): The directory of the ResultStore to write the
+                               results to.
+            workers     (int, optional): The amount of processes, defaults to
+                                         the amount of CPUs.
+            seed        (int, optional): Seed from which the seed of every run
+                                         is derived.
+            flush_every (int, optional): The amount of finished runs appended
+                                         to the store at once.
+            model_params (dict, optional): Fixed keyword arguments of WolfElk
+                                           for every run, e.g. stopping
+                                           criteria such as
+                                           {'stop_on_extinction': True}.
+                                           The reporters then hold the
+                                           values of the step the run
+                                           stopped, its step count is
+                                           recorded in the 'Steps' column.
+            warm_start (WarmStartCache, optional): Cache of burned-in states
+                                           the runs start from. The
+                                           replicates of a sample share its
+                                           states.
+        """
+        self.analysis = analysis
+        self.output_path = output_path
+        self.store = ResultStore(output_path, analysis.problems['names'])
+        self.workers = workers
+        self.seed = seed
+        self.flush_every = flush_every
+        self.model_params = dict(model_params or {})
+        self.warm_start = warm_start
+
+    def tasks(self, distinct_samples):
+        """
+        Creates the list of all runs of the analysis: every replicate of every
+        Saltelli sample. A run is identified by its 'Run' number, which is the
+        same as the count in SensitivityAnalysis.run_analysis.
+        Args:
+            distinct_samples (int): Amount of distinct samples.
+        Returns:
+            List of tuples with the arguments for run_sample.
+        """
+        analysis = self.analysis
+        param_values = saltelli.sample(
+            analysis.problems, distinct_samples, False
+        )
+        total = analysis.replicates * len(param_values)
+        seeds = WolfElk.spawn_seeds(self.seed, total)
+
+        tasks = []
+        for replicate in range(analysis.replicates):
+            for i, vals in enumerate(param_values):
+                run = replicate * len(param_values) + i
+                vals, parameters = analysis.sample_parameters(vals)
+                tasks.append((
+                    run,
+                    parameters,
+                    self.model_params,
+                    analysis.max_steps,
+                    seeds[run],
+                    analysis.model_reporters,
+                    self.warm_start
+                ))
+        return tasks
+
+    def completed_runs(self):
+        """
+        Returns the set of runs which are already recorded in the store.
+        """
+        runs = self.store.load(['Run']).get('Run')
+        if runs is None:
+            return set()
+        return set(runs.tolist())
+
+    def run(self, distinct_samples, chunksize=8):
+        """
+        Runs all runs of the analysis which are not yet recorded.
+        Args:
+            distinct_samples (int): Amount of distinct samples.
+            chunksize (int, optional): The amount of runs sent to a worker at
+                                       once.
+        Returns:
+            Pandas Dataframe with the results of all runs, sorted by run.
+        """
+        done = self.completed_runs()
+        tasks = [
+            task for task in self.tasks(distinct_samples)
+            if task[0] not in done
+        ]
+        with ProcessPoolExecutor(self.workers) as executor:
+            records = []
+            for record in executor.map(run_sample, tasks, chunksize=chunksize):
+                records.append(record)
+                if len(records) >= self.flush_every:
+                    self.store.append(records)
+                    records = []
+            self.store.append(records)
+
+        # Store the runs in run order, so they can be memory mapped for
+        # sobol.analyze.
+        self.store.compact(sort_by='Run')
+        return self.store.read(self.analysis.data_definition)
+
+
+def run_sample(task):
+    """
+    Runs the model for a single run of a SobolEngine.
+    Args:
+        task (tuple): Run number, sampled model parameters, fixed model
+                      parameters, maximum steps, seed, the model reporters
+                      and the WarmStartCache or None.
+    Returns:
+        Dictionary with the parameters, the run, the amount of steps taken
+        and the reporter values.
+    """
+    (run, parameters, model_params, max_steps, seed, model_reporters,
+     warm_start) = task
+    if warm_start is None:
+        model = WolfElk(**dict(model_params, **parameters), seed=seed)
+    else:
+        model = warm_start.get_model(dict(model_params, **parameters), seed)
+    # Stops early when the model meets one of its stopping criteria.
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+
+    record = dict(parameters)
+    record['Run'] = run
+    record['Steps'] = model.schedule.steps
+    for name, reporter in model_reporters.items():
+        record[name] = reporter(model)
+    return record
+
+
 if __name__ == "__main__":
     """
     Define Sensitivity Parameters below. This calls the Sensitivity Analysis
@@ -179,20 +352,23 @@ if __name__ == "__main__":
     below on line 200.
 
     NOTE: Parameter run_analysis should be set to True to actually run the
-    analysis. Otherwise only plots are made if the result.csv is present.
+    analysis. Otherwise only plots are made if the result store (or the
+    result csv) is present.
     """
     run_analysis = False
+    # Amount of processes to run the analysis in, None uses all CPUs.
+    workers = None
 
     replicates = 10
     max_steps = 200
     distinct_samples = 500
-    # Set the outputs
+    # Set the outputs. The reporters are module level functions so they can
+    # be sent to the worker processes.
     model_reporters = {
-        "Wolves": lambda m: m.get_wolf_breed_count(),
-        "Elks": lambda m: m.schedule.get_breed_count(Elk),
-        "Elks age": lambda m: m.schedule.get_average_age(Elk),
-        "Killed Elks/Wolf": lambda m:
-            m.schedule.get_average_kills(Wolf)
+        "Wolves": report_wolves,
+        "Elks": report_elks,
+        "Elks age": report_elks_age,
+        "Killed Elks/Wolf": report_kills
     }
 
     # Define variables which should be included in the sensitivity analysis
@@ -216,34 +392,43 @@ if __name__ == "__main__":
         model_reporters
     )
 
+    store_path = 'results/sa_result_new'
     if (run_analysis):
-        analysis_data = SA.run_analysis(distinct_samples)
-        analysis_data.to_csv('results/sa_result_new.csv')
-    else:
-        analysis_data = pd.read_csv('results/sa_result_new.csv')
+        # Runs which are already in the result store are skipped.
+        engine = SobolEngine(SA, store_path, workers)
+        engine.run(distinct_samples)
+    elif not os.path.exists(store_path):
+        # Convert the csv-file of an earlier analysis once.
+        ResultStore.from_csv(
+            'results/sa_result_new.csv', store_path, SA.problems['names']
+        )
+    # The result columns are memory mapped, not parsed.
+    analysis_data = ResultStore(store_path).load(
+        ['Elks', 'Wolves', 'Killed Elks/Wolf', 'Elks age']
+    )
 
     problem = SA.parse_problems(problem_set)
     Si_elk = sobol.analyze(
         problem,
-        analysis_data['Elks'].values,
+        analysis_data['Elks'],
         calc_second_order=False,
         print_to_console=True
     )
     Si_wolves = sobol.analyze(
         problem,
-        analysis_data['Wolves'].values,
+        analysis_data['Wolves'],
         calc_second_order=False,
         print_to_console=True
     )
     Si_kills = sobol.analyze(
         problem,
-        analysis_data['Killed Elks/Wolf'].values,
+        analysis_data['Killed Elks/Wolf'],
         calc_second_order=False,
         print_to_console=True
     )
     Si_age = sobol.analyze(
         problem,
-        analysis_data['Elks age'].values,
+        analysis_data['Elks age'],
         calc_second_order=False,
         print_to_console=True
     )
@@ -11,8 +11,8 @@ DESCRIPTION:This class contains definitions of two of the four agents in this
             A small part of the code (the GrassPatch) is from Mesa Examples:
             https://github.com/projectmesa/mesa/tree/master/examples/wolf_sheep
 """
-from mesa import Agent
-from .walker import Walker
+from .walker import CompactAgent, Walker
+from .trace import EventTrace
 
 import random
 import logging
@@ -22,6 +22,8 @@ class Elk(Walker):
     """
     A elk that walks around, reproduces (asexually) and gets eaten.
     """
+    __slots__ = ('energy', 'age')
+
     def __init__(self, unique_id, pos, model, moore, age, energy):
         """
         Create a Pack.
@@ -43,16 +45,19 @@ class Elk(Walker):
         """
         self.random_move()
         self.age += self.model.time_per_step
+        self.model.schedule.update_sum(self, 'age', self.model.time_per_step)
         self.energy -= 1
 
         # If there is grass available, eat it
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        grass_patch = [
-            obj for obj in this_cell if isinstance(obj, GrassPatch)
-        ][0]
-        if grass_patch.fully_grown:
-            self.energy += self.model.elk_gain_from_food
-            grass_patch.fully_grown = False
+        if self.model.grass_field is not None:
+            if self.model.grass_field.eat(self.pos):
+                self.energy += self.model.elk_gain_from_food
+        else:
+            x, y = self.pos
+            grass_patch = self.model.grass_patches[x][y]
+            if grass_patch.fully_grown:
+                self.energy += self.model.elk_gain_from_food
+                grass_patch.fully_grown = False
 
         # Death
         if self.energy < 0:
@@ -72,32 +77,25 @@ class Elk(Walker):
             )
             self.model.grid.place_agent(calf, self.pos)
             self.model.schedule.add(calf)
+            if self.model.trace is not None:
+                self.model.trace.record(
+                    EventTrace.ELK_BORN, self.unique_id, self.pos,
+                    calf.unique_id
+                )
 
     def compute_reproduction_prob(self):
         """
         Computes the probability of reproduction based on the age of the elk
         """
-        degree = self.model.polynomial_degree
-        return max(
-            0,
-            sum([
-                self.model.elk_reproduction_params[i]*self.age**(degree-i)
-                for i in range(degree+1)
-            ])
-        )
-
-    # Equality operators to overrule comparison in the heapq
-    def __eq__(self, other):
-        self.__class__ == other.__class__ and self.pos == other.pos
+        return self.model.elk_reproduction_table(self.age)
 
-    def __lt__(self, other):
-        return True
 
-
-class GrassPatch(Agent):
+class GrassPatch(CompactAgent):
     """
     A patch of grass that grows at a fixed rate and it is eaten by elk
     """
+    __slots__ = ('fully_grown', 'countdown')
+
     def __init__(self, unique_id, pos, model, fully_grown, countdown):
         """
         Creates a new patch of grass
@@ -105,10 +103,9 @@ class GrassPatch(Agent):
             grown (boolean): Whether the patch of grass is fully grown or not.
             countdown (int): Time for the patch of grass to be fully grown.
         """
-        super().__init__(unique_id, model)
+        super().__init__(unique_id, model, pos)
         self.fully_grown = fully_grown
         self.countdown = countdown
-        self.pos = pos
 
     def step(self):
         if not self.fully_grown:
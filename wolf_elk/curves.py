@@ -0,0 +1,287 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Fitting of the empirical elk data and lookup tables for the
+             fitted polynomials.
+
+             The fits only depend on the data file and the polynomial degree,
+             so they are computed once per process and shared by all models.
+             If the environment variable WOLF_ELK_CACHE_DIR is set, the fits
+             are also stored on disk so other (worker) processes can skip
+             them.
+
+             The ages of elk only change in steps of time_per_step, so the
+             fitted curves are evaluated once on that lattice and agents index
+             the table instead of evaluating the polynomial every step.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from .files import atomic_write
+
+ELK_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'empirical_data',
+    'elk_ratesbyage.csv'
+)
+CACHE_DIR = os.environ.get('WOLF_ELK_CACHE_DIR')
+
+# Ages of the initial elk population, in steps of two weeks.
+ELK_AGES = np.arange(1, 20.01, 1/26)
+
+# Ages which differ less than this from a lattice point use the table.
+AGE_TOLERANCE = 1e-9
+
+# (data path, polynomial degree) -> dictionary with the fitted curves.
+_fit_cache = {}
+# (data path, polynomial degree, time per step) -> (reproduction table,
+# wolf-kill table)
+_table_cache = {}
+
+
+def get_elk_fits(data_path=ELK_DATA_PATH, degree=10):
+    """
+    Returns the curves fitted to the elk data, computing them only the first
+    time they are requested in this process.
+    Args:
+        data_path (str): Path of the csv-file with the elk rates by age.
+        degree    (int): The degree of the fitted polynomials.
+    Returns:
+        Dictionary with the (read-only) arrays 'age_distribution',
+        'reproduction_params' and 'wolfkill_params'.
+    """
+    key = (os.path.abspath(data_path), degree)
+    fits = _fit_cache.get(key)
+    if fits is None:
+        cache_file = _cache_file(*key) if CACHE_DIR else None
+        if cache_file and os.path.exists(cache_file):
+            with np.load(cache_file) as stored:
+                fits = {name: stored[name] for name in stored.files}
+        else:
+            fits = fit_elk_data(*key)
+            if cache_file:
+                _store_fits(cache_file, fits)
+        for values in fits.values():
+            values.setflags(write=False)
+        _fit_cache[key] = fits
+    return fits
+
+
+def get_age_tables(data_path=ELK_DATA_PATH, degree=10, time_per_step=1/26):
+    """
+    Returns the AgeTables of the elk reproduction chance and the wolf-kill
+    probability, shared by all models in this process with the same data,
+    degree and time per step.
+    Args:
+        data_path       (str): Path of the csv-file with the elk rates by age.
+        degree          (int): The degree of the fitted polynomials.
+        time_per_step (float): The age increment per time step.
+    Returns:
+        Tuple with the reproduction table and the wolf-kill table.
+    """
+    key = (os.path.abspath(data_path), degree, time_per_step)
+    tables = _table_cache.get(key)
+    if tables is None:
+        fits = get_elk_fits(data_path, degree)
+        tables = (
+            AgeTable(fits['reproduction_params'], time_per_step, minimum=0),
+            AgeTable(fits['wolfkill_params'], time_per_step, minimum=0.001)
+        )
+        for table in tables:
+            table.table.setflags(write=False)
+            table.ages.setflags(write=False)
+        _table_cache[key] = tables
+    return tables
+
+
+def fit_elk_data(data_path, degree):
+    """
+    Reads the elk data and fits all curves used by the model.
+    Args:
+        data_path (str): Path of the csv-file with the elk rates by age.
+        degree    (int): The degree of the fitted polynomials.
+    Returns:
+        Dictionary with the arrays 'age_distribution', 'reproduction_params'
+        and 'wolfkill_params'.
+    """
+    df = pd.read_csv(data_path, sep=',')
+    return {
+        'age_distribution': fit_elk_age_distr(df, degree),
+        'reproduction_params': fit_elk_reproduction_chance(df, degree),
+        'wolfkill_params': fit_elk_wolfkill_by_age(df, degree)
+    }
+
+
+def fit_elk_reproduction_chance(df, degree):
+    """
+    Fits a polynomial to the elk reproduction data, used for interpolation
+    Args:
+        df (pd.DataFrame): The elk rates by age.
+        degree      (int): The degree of the polynomial.
+    Returns:
+        Coefficients for polynomial.
+    """
+    all_ages = np.append([1], df['age'].values)
+    all_preg_rate = np.append([0], df['preg_rate'])/26
+
+    params = np.polyfit(all_ages, all_preg_rate, deg=degree)
+
+    return params
+
+
+def fit_elk_age_distr(df, degree):
+    """
+    Fits a polynomial to the survival rate per elk age, used for
+    interpolation.
+    Args:
+        df (pd.DataFrame): The elk rates by age.
+        degree      (int): The degree of the polynomial.
+    Returns:
+        Probability distribution of elk ages
+    """
+    all_ages = np.append([1], df['age'].values)
+    all_surv_rate = np.append([0.9], df['surv_rate'].values)
+
+    # Compute share of population by age
+    all_surv_rate = all_surv_rate/sum(all_surv_rate)
+
+    # Fit polynomial
+    params = np.polyfit(all_ages, all_surv_rate, deg=degree)
+
+    # Compute chances
+    chances = np.polyval(params, ELK_AGES)
+    chances = chances/chances.sum()
+
+    return chances
+
+
+def fit_elk_wolfkill_by_age(df, degree):
+    """
+    Fits a polynomial to the data of wolf-kills per elk age, used for
+    interpolation.
+    Args:
+        df (pd.DataFrame): The elk rates by age.
+        degree      (int): The degree of the polynomial.
+    Returns:
+        Coefficients for polynomial.
+    """
+    all_ages = np.append([1], df['age'].values)
+    all_perc_killed = np.append([50], (df['perc_of_killed'].values)/2)/100
+    all_surv_rate = np.append([0.9], df['surv_rate'].values)
+
+    P_kill_by_wolf = 1100/1350
+
+    def bayes_func(i):
+        return (
+            (all_perc_killed[i] / all_surv_rate[i] * P_kill_by_wolf)
+            / all_surv_rate[i]
+        )
+
+    # Apply Bayes' Theorem
+    P_kill_wolf_byage = np.array([
+        bayes_func(i) for i, _ in enumerate(all_ages)
+    ])
+
+    # Fit polynomial
+    params = np.polyfit(all_ages, P_kill_wolf_byage, deg=degree)
+    return params
+
+
+def _cache_file(data_path, degree):
+    """
+    Returns the path of the disk cache for the fits of a data file. The name
+    depends on the modification time of the data, so changed data is refit.
+    """
+    stat = os.stat(data_path)
+    key = "{}|{}|{}|{}".format(data_path, stat.st_mtime_ns, stat.st_size,
+                               degree)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, "elk_fits_{}.npz".format(digest))
+
+
+def _store_fits(cache_file, fits):
+    """
+    Writes the fits to the disk cache. The file is written under a temporary
+    name and renamed, so concurrent workers never read a partial file.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with atomic_write(cache_file) as tmp_file:
+        np.savez(tmp_file, **fits)
+
+
+class AgeTable():
+    """
+    Dense lookup table of a polynomial in the age of an elk, clipped from
+    below at a minimum value.
+    """
+    def __init__(self, params, time_per_step, minimum, max_age=40):
+        """
+        Args:
+            params     (array): Coefficients of the polynomial, highest power
+                                first (as returned by np.polyfit).
+            time_per_step (float): The age increment per time step.
+            minimum    (float): Lower bound of the returned values.
+            max_age      (int): The table covers ages 0 up to max_age. Other
+                                ages are evaluated directly.
+        """
+        self.params = np.asarray(params, dtype=float)
+        self.time_per_step = time_per_step
+        self.minimum = minimum
+        size = int(round(max_age / time_per_step)) + 1
+        self.ages = np.arange(size) * time_per_step
+        self.table = self.evaluate(self.ages)
+
+        # Python lists are faster to index with a single age.
+        self._ages = self.ages.tolist()
+        self._table = self.table.tolist()
+
+    def evaluate(self, ages):
+        """
+        Evaluates the polynomial without using the table.
+        Args:
+            ages (array-like): Ages to evaluate.
+        Returns:
+            Array with the clipped polynomial values.
+        """
+        return np.maximum(self.minimum, np.polyval(self.params, ages))
+
+    def __call__(self, age):
+        """
+        Returns the value of the curve for a single age.
+        Args:
+            age (float): Age of the elk.
+        """
+        index = int(age / self.time_per_step + 0.5)
+        if (
+            0 <= index < len(self._table) and
+            abs(self._ages[index] - age) < AGE_TOLERANCE
+        ):
+            return self._table[index]
+        return max(self.minimum, float(np.polyval(self.params, age)))
+
+    def values(self, ages):
+        """
+        Returns the value of the curve for an array of ages.
+        Args:
+            ages (array-like): Ages of the elk.
+        Returns:
+            Array with a value per age.
+        """
+        ages = np.asarray(ages, dtype=float)
+        index = np.rint(ages / self.time_per_step).astype(np.int64)
+        inside = (index >= 0) & (index < len(self.table))
+        index[~inside] = 0
+        on_table = inside & (np.abs(self.ages[index] - ages) < AGE_TOLERANCE)
+
+        values = self.table[index]
+        if not on_table.all():
+            values[~on_table] = self.evaluate(ages[~on_table])
+        return values
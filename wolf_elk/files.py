@@ -0,0 +1,82 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: File helpers shared by the result sinks, the result store, the
+             disk cache of the fits and the warm-start cache: advisory file
+             locks between processes and files which are replaced atomically,
+             so a reader never sees a partially written file.
+"""
+from contextlib import contextmanager
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking on this platform, only a single writer is safe.
+    fcntl = None
+
+
+def lock_file(file, shared=False):
+    """
+    Locks an open file, waiting until the lock is available.
+    Args:
+        file (file): The open file.
+        shared (bool, optional): Whether to take a shared (read) lock instead
+                                 of an exclusive one.
+    """
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def unlock_file(file):
+    """
+    Releases the lock of an open file.
+    """
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked(path, shared=False):
+    """
+    Context manager which holds a lock on a lock file, which is created when
+    it does not exist.
+    Args:
+        path    (str): The lock file.
+        shared (bool, optional): Whether to take a shared lock.
+    """
+    with open(path, 'a') as lock:
+        lock_file(lock, shared)
+        try:
+            yield
+        finally:
+            unlock_file(lock)
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Context manager which yields a binary file that replaces the file at the
+    path when the block ends without an error. The data is written to a
+    hidden temporary file in the same directory first.
+    Args:
+        path (str): The file to write.
+    """
+    directory, name = os.path.split(path)
+    handle, temporary = tempfile.mkstemp(
+        dir=directory or '.', prefix='.', suffix=os.path.splitext(name)[1]
+    )
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            yield output
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
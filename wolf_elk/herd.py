@@ -0,0 +1,317 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: The elk population of the model. Wolves and packs only use the
+             elk through the methods defined here (finding elk in a cell or
+             radius, reading their ages and positions and killing them), so
+             the model can run with either of two backends:
+
+             ElkAgents: every elk is an Elk agent in the scheduler and on the
+                        grid. Elk are referred to by their agent.
+             ElkHerd:   all elk are stored as NumPy columns (position, age,
+                        energy) and are advanced in batched operations once
+                        per step. Elk are referred to by their index in the
+                        columns, which stays valid until the next step.
+"""
+import numpy as np
+
+from .agents import Elk
+from .space import moore_offsets
+from .trace import EventTrace
+
+
+class ElkAgents():
+    """
+    Elk population where every elk is an Elk agent.
+    """
+    def __init__(self, model):
+        """
+        Args:
+            model (mesa.Model): The model the elk live in.
+        """
+        self.model = model
+
+    def step(self):
+        """
+        Elk agents are stepped by the scheduler.
+        """
+
+    def count(self):
+        """
+        Returns the amount of living elk.
+        """
+        return self.model.schedule.get_breed_count(Elk)
+
+    def average_age(self):
+        """
+        Returns the average age of the living elk.
+        """
+        return self.model.schedule.get_average_age(Elk)
+
+    def in_cell(self, pos):
+        """
+        Returns the elk in a cell.
+        Args:
+            pos (tuple): The coordinates of the cell.
+        """
+        return self.model.grid.get_breed_cell_contents(pos, Elk)
+
+    def in_radius(self, pos, radius, include_center=False):
+        """
+        Returns the elk in the Moore neighborhood of a cell.
+        Args:
+            pos           (tuple): The coordinates of the center cell.
+            radius          (int): Radius of the neighborhood.
+            include_center (bool): Whether to include the center cell.
+        """
+        return self.model.grid.get_breed_neighbors(
+            pos, Elk, radius=radius, include_center=include_center
+        )
+
+    def ages(self, elk):
+        """
+        Returns the ages of the given elk as an array.
+        """
+        return np.array([ind_elk.age for ind_elk in elk], dtype=float)
+
+    def unique_ids(self, elk):
+        """
+        Returns the unique ids of the given elk as an array.
+        """
+        return np.array([ind_elk.unique_id for ind_elk in elk], dtype=np.int64)
+
+    def position(self, ind_elk):
+        """
+        Returns the position of an elk.
+        """
+        return ind_elk.pos
+
+    def kill(self, elk, hunters):
+        """
+        Removes killed elk from the model.
+        Args:
+            elk     (list): The elk to kill.
+            hunters (list): Per elk the wolf or pack which killed it.
+        """
+        trace = self.model.trace
+        for ind_elk, hunter in zip(elk, hunters):
+            if trace is not None:
+                trace.record(
+                    EventTrace.ELK_KILLED, hunter.unique_id, hunter.pos,
+                    ind_elk.unique_id
+                )
+            self.model.grid.remove_agent(ind_elk)
+            self.model.schedule.remove(ind_elk)
+
+
+class ElkHerd():
+    """
+    Elk population stored as columns. Every step all elk move, age, eat,
+    starve and reproduce in batched array operations, with the same rules as
+    Elk.step. Killed elk are marked as dead and removed at the next step.
+    """
+    # Moves of the Moore neighborhood, including staying in the cell.
+    MOVES = np.array(
+        [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64
+    )
+
+    def __init__(self, model, positions, ages, energies):
+        """
+        Args:
+            model (mesa.Model): The model the elk live in. Needs a GrassField.
+            positions  (array): Positions of the initial elk, shape (n, 2).
+            ages       (array): Ages of the initial elk.
+            energies   (array): Energies of the initial elk.
+        """
+        self.model = model
+        self.width = model.grid.width
+        self.height = model.grid.height
+        number = len(ages)
+        positions = np.asarray(positions, dtype=np.int64).reshape((number, 2))
+
+        self.ids = self.next_ids(number)
+        self.x = positions[:, 0].copy()
+        self.y = positions[:, 1].copy()
+        self.age = np.asarray(ages, dtype=float)
+        self.energy = np.asarray(energies, dtype=float)
+        self.alive = np.ones(number, dtype=bool)
+        self.living = number
+        self.build_index()
+
+    def next_ids(self, number):
+        """
+        Reserves unique ids for new elk, from the same counter as the agents.
+        """
+        first = self.model.current_id + 1
+        self.model.current_id += number
+        return np.arange(first, first + number, dtype=np.int64)
+
+    def build_index(self):
+        """
+        Sorts the elk by cell, so the elk of a cell are the slice
+        order[cell_start[cell]:cell_start[cell + 1]].
+        """
+        cells = self.x * self.height + self.y
+        self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.width * self.height)
+        self.cell_start = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_start[1:])
+
+    def step(self):
+        """
+        Advances all elk by one step.
+        """
+        model = self.model
+        rng = model.rng
+        # Remove the elk killed by wolves since the last step.
+        self.remove_dead()
+        number = len(self.age)
+
+        # Move to a random cell of the Moore neighborhood
+        moves = self.MOVES[rng.integers(len(self.MOVES), size=number)]
+        self.x = (self.x + moves[:, 0]) % self.width
+        self.y = (self.y + moves[:, 1]) % self.height
+        self.age += model.time_per_step
+        self.energy -= 1
+
+        # In random order, the first elk in a cell with grass eats it.
+        cells = self.x * self.height + self.y
+        order = rng.permutation(number)
+        _, first = np.unique(cells[order], return_index=True)
+        eaters = order[first]
+        eaten = model.grass_field.eat_cells(cells[eaters])
+        self.energy[eaters[eaten]] += model.elk_gain_from_food
+
+        # Death
+        self.alive = self.energy >= 0
+
+        # Reproduction of the living elk
+        prob = model.elk_reproduction_table.values(self.age)
+        parents = np.flatnonzero(self.alive & (rng.random(number) < prob))
+        self.energy[parents] /= 2
+        calves = self.next_ids(len(parents))
+        if model.trace is not None:
+            for parent, calf in zip(parents, calves):
+                model.trace.record(
+                    EventTrace.ELK_BORN, int(self.ids[parent]),
+                    self.position(parent), int(calf)
+                )
+        self.ids = np.concatenate([self.ids, calves])
+        self.x = np.concatenate([self.x, self.x[parents]])
+        self.y = np.concatenate([self.y, self.y[parents]])
+        self.age = np.concatenate([self.age, np.zeros(len(parents))])
+        self.energy = np.concatenate([self.energy, self.energy[parents]])
+        self.alive = np.concatenate(
+            [self.alive, np.ones(len(parents), dtype=bool)]
+        )
+
+        self.remove_dead()
+        self.build_index()
+
+    def remove_dead(self):
+        """
+        Removes the dead elk from the columns. Indices of elk are only valid
+        until this is called.
+        """
+        if not self.alive.all():
+            alive = self.alive
+            self.ids = self.ids[alive]
+            self.x = self.x[alive]
+            self.y = self.y[alive]
+            self.age = self.age[alive]
+            self.energy = self.energy[alive]
+            self.alive = self.alive[alive]
+        self.living = len(self.ids)
+
+    def count(self):
+        """
+        Returns the amount of living elk.
+        """
+        return self.living
+
+    def average_age(self):
+        """
+        Returns the average age of the living elk.
+        """
+        if self.living == 0:
+            return 0
+        return float(self.age[self.alive].sum()) / self.living
+
+    def in_cell(self, pos):
+        """
+        Returns the indices of the living elk in a cell.
+        Args:
+            pos (tuple): The coordinates of the cell.
+        """
+        x, y = pos
+        cell = x * self.height + y
+        indices = self.order[self.cell_start[cell]:self.cell_start[cell + 1]]
+        return indices[self.alive[indices]]
+
+    def in_radius(self, pos, radius, include_center=False):
+        """
+        Returns the indices of the living elk in the Moore neighborhood of a
+        cell. The grid is a torus.
+        Args:
+            pos           (tuple): The coordinates of the center cell.
+            radius          (int): Radius of the neighborhood.
+            include_center (bool): Whether to include the center cell.
+        """
+        dx, dy = moore_offsets(radius, include_center)
+        x, y = pos
+        cells = ((x + dx) % self.width) * self.height + (y + dy) % self.height
+        if 2 * radius + 1 > min(self.width, self.height):
+            # The neighborhood wraps around onto itself.
+            cells = np.unique(cells)
+            if not include_center:
+                cells = cells[cells != x * self.height + y]
+
+        starts = self.cell_start[cells]
+        lengths = self.cell_start[cells + 1] - starts
+        total = lengths.sum()
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Concatenate the slices of all cells
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        indices = self.order[offsets + np.arange(total)]
+        return indices[self.alive[indices]]
+
+    def ages(self, elk):
+        """
+        Returns the ages of the elk with the given indices.
+        """
+        return self.age[np.asarray(elk, dtype=np.int64)]
+
+    def unique_ids(self, elk):
+        """
+        Returns the unique ids of the elk with the given indices.
+        """
+        return self.ids[np.asarray(elk, dtype=np.int64)]
+
+    def position(self, index):
+        """
+        Returns the position of the elk with the given index.
+        """
+        return (int(self.x[index]), int(self.y[index]))
+
+    def kill(self, elk, hunters):
+        """
+        Marks killed elk as dead.
+        Args:
+            elk     (array): Indices of the elk to kill.
+            hunters  (list): Per elk the wolf or pack which killed it.
+        """
+        elk = np.asarray(elk, dtype=np.int64)
+        if self.model.trace is not None:
+            for index, hunter in zip(elk, hunters):
+                self.model.trace.record(
+                    EventTrace.ELK_KILLED, hunter.unique_id, hunter.pos,
+                    int(self.ids[index])
+                )
+        self.alive[elk] = False
+        self.living -= len(elk)
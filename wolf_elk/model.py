@@ -17,16 +17,32 @@ DESCRIPTION: Class containing the definitions to run the model. This file
 """
 
 from mesa import Model
-from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
 
+from collections import deque
 import logging
+import os
+import pickle
+import random
+import zlib
 import numpy as np
 import pandas as pd
 
 from .agents import Elk, GrassPatch
 from .wolf import Wolf, Pack
 from .schedule import RandomActivationByBreed
+from .space import BreedGrid
+from .vegetation import GrassField
+from .trace import EventTrace
+from .profiler import StepProfiler
+from .herd import ElkAgents, ElkHerd
+from .curves import (
+    AgeTable, get_age_tables, get_elk_fits, ELK_AGES, ELK_DATA_PATH
+)
+
+
+# zlib compression level of the snapshots of checkpoint()
+SNAPSHOT_LEVEL = 6
 
 
 class WolfElk(Model):
@@ -53,7 +69,18 @@ class WolfElk(Model):
         wolf_territorium=8,
         polynomial_degree=10,
         wolf_lone_attack_prob=0.2,
-        time_per_step=1/26
+        time_per_step=1/26,
+        grass_engine='agents',
+        elk_engine='agents',
+        data_path=ELK_DATA_PATH,
+        seed=None,
+        debug=None,
+        trace_events=False,
+        profile=False,
+        stop_on_extinction=False,
+        population_cap=None,
+        steady_state_window=None,
+        steady_state_tolerance=1.0
     ):
         """
         Create a new Wolf-elk model with the given parameters.
@@ -79,8 +106,61 @@ class WolfElk(Model):
                                  attacking the elk alone.
             time_per_step:       The real time duration simulated in each
                                  time step
+            grass_engine:        How the grass is simulated: 'agents' uses a
+                                 GrassPatch agent per cell, 'array' keeps the
+                                 grass of the whole grid in a GrassField.
+            elk_engine:          How the elk are simulated: 'agents' uses an
+                                 Elk agent per elk, 'array' stores all elk in
+                                 an ElkHerd and advances them in batch. The
+                                 'array' engine needs grass_engine='array'.
+            data_path:           Path of the csv-file with the elk rates by
+                                 age, to which the polynomials are fitted.
+            seed:                Seed of the run. It seeds both the Mesa
+                                 generator (self.random) and the NumPy
+                                 generator (self.rng) of the model; all random
+                                 draws come from these two. If None, a random
+                                 seed is drawn and stored in self.seed.
+            debug:               Whether the agents write debug messages to
+                                 the log. If None, only when the root logger
+                                 is at DEBUG level (see wolf_elk/__init__.py).
+            trace_events:        Whether to record births, kills and the
+                                 forming and disbanding of packs in an
+                                 EventTrace, available as self.trace.
+            profile:             Whether to record the time and calls of the
+                                 step of every breed, the phases of the model
+                                 step and the grid operations, available with
+                                 get_profile_dataframe().
+            stop_on_extinction:  Whether to stop the run when all wolves or
+                                 all elk are dead.
+            population_cap:      If set, the run stops when the amount of
+                                 wolves or of elk exceeds it.
+            steady_state_window: If set, the run stops when the variance of
+                                 both the wolf and the elk count over the last
+                                 steady_state_window steps is below
+                                 steady_state_tolerance.
+            steady_state_tolerance: The variance below which the counts are
+                                 steady, see steady_state_window.
         """
+        if grass_engine not in ('agents', 'array'):
+            raise ValueError(
+                "Unknown grass engine '{}'".format(grass_engine)
+            )
+        if elk_engine not in ('agents', 'array'):
+            raise ValueError("Unknown elk engine '{}'".format(elk_engine))
+        if elk_engine == 'array' and grass_engine != 'array':
+            raise ValueError("The 'array' elk engine needs the 'array' grass \
+engine")
+        if steady_state_window is not None and steady_state_window < 2:
+            raise ValueError("The steady state window needs at least 2 steps")
+
         super().__init__()
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        # Mesa stores the generator on the class, give each model its own.
+        self._seed = seed
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed))
         # Set parameters
         self.height = height
         self.width = width
@@ -95,153 +175,406 @@ class WolfElk(Model):
         self.wolf_territorium = wolf_territorium
         self.wolf_lone_attack_prob = wolf_lone_attack_prob
         self.polynomial_degree = polynomial_degree
+        self.data_path = data_path
         self.elk_age_distribution = self.fit_elk_age_distr()
         self.elk_reproduction_params = self.fit_elk_reproduction_chance()
         self.elk_wolfkill_params = self.fit_elk_wolfkill_by_age()
         self.time_per_step = time_per_step
-
-        self.schedule = RandomActivationByBreed(self)
-        self.grid = MultiGrid(self.height, self.width, torus=True)
+        # The lookup tables are shared by all models in the process.
+        self.elk_reproduction_table, self.elk_wolfkill_table = get_age_tables(
+            self.data_path, self.polynomial_degree, self.time_per_step
+        )
+        self.grass_engine = grass_engine
+        self.elk_engine = elk_engine
+        self.grass_field = None
+        self.grass_patches = None
+        if debug is None:
+            debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self.debug = debug
+        self.trace = EventTrace(self) if trace_events else None
+        # Stopping criteria, checked after every step.
+        self.stop_on_extinction = stop_on_extinction
+        self.population_cap = population_cap
+        self.steady_state_window = steady_state_window
+        self.steady_state_tolerance = steady_state_tolerance
+        self.stop_reason = None
+        if steady_state_window is not None:
+            # (wolves, elk) of the last steps
+            self.population_history = deque(maxlen=steady_state_window)
+        else:
+            self.population_history = None
+        # Packs which moved in the current step and hunt in the hunt phase.
+        self.hunting_packs = []
+        # Time of the schedule at the start of the current step. The events
+        # of all phases of a step are recorded with it, also those after the
+        # scheduler has advanced its time.
+        self.step_time = 0
+
+        self.profiler = StepProfiler() if profile else None
+        self.schedule = RandomActivationByBreed(self, profiler=self.profiler)
+        self.grid = BreedGrid(self.height, self.width, torus=True)
+        if self.profiler is not None:
+            self.profiler.instrument_grid(self.grid)
+        # The reporters read the statistics computed once per step. They are
+        # module level functions, so the model can be pickled.
         self.datacollector = DataCollector(
             {
-                "Wolves": lambda m: m.get_wolf_breed_count(),
-                "Elks": lambda m: m.schedule.get_breed_count(Elk),
-                "Elks age": lambda m: m.schedule.get_average_age(Elk),
-                "Killed Elks/Wolf": lambda m:
-                    m.schedule.get_average_kills(Wolf),
-                "Packs": lambda m: m.schedule.get_breed_count(Pack)
+                "Wolves": report_wolves,
+                "Elks": report_elks,
+                "Elks age": report_elks_age,
+                "Killed Elks/Wolf": report_kills,
+                "Packs": report_packs
             }
         )
 
-        # Create elk:
-        for _ in range(self.initial_elk):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            age = np.random.choice(
-                np.arange(1, 20.01, 1/26), p=self.elk_age_distribution)
-            energy = self.random.uniform(
-                self.elk_gain_from_food, 2 * self.elk_gain_from_food)
-            elk = Elk(self.next_id(), (x, y), self, True, age, energy)
-            self.grid.place_agent(elk, (x, y))
+        self.create_elk()
+        self.create_wolves()
+        self.create_grass()
+
+        self.running = True
+        self.update_statistics()
+        self.datacollector.collect(self)
+        if self.profiler is not None:
+            # The grid operations of the setup are recorded as step 0.
+            self.profiler.end_step(self.schedule.time)
+
+    def random_positions(self, number):
+        """
+        Draws random positions on the grid.
+        Args:
+            number (int): The amount of positions to draw.
+        Returns:
+            List with (x, y) tuples.
+        """
+        x = self.rng.integers(self.grid.width, size=number)
+        y = self.rng.integers(self.grid.height, size=number)
+        return list(zip(x.tolist(), y.tolist()))
+
+    def create_elk(self):
+        """
+        Creates the initial elk, as Elk agents or as an ElkHerd. Ages,
+        energies and positions of all elk are drawn at once.
+        """
+        positions = self.random_positions(self.initial_elk)
+        ages = self.rng.choice(
+            ELK_AGES, size=self.initial_elk, p=self.elk_age_distribution
+        )
+        energies = self.rng.uniform(
+            self.elk_gain_from_food,
+            2 * self.elk_gain_from_food,
+            size=self.initial_elk
+        )
+        if self.elk_engine == 'array':
+            self.elk_population = ElkHerd(self, positions, ages, energies)
+            return
+
+        self.elk_population = ElkAgents(self)
+        for pos, age, energy in zip(
+            positions, ages.tolist(), energies.tolist()
+        ):
+            elk = Elk(self.next_id(), pos, self, True, age, energy)
+            self.grid.place_agent(elk, pos)
             self.schedule.add(elk)
 
-        # Create wolves
-        for _ in range(self.initial_wolves):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            energy = self.random.uniform(
-                self.energy_threshold, 2 * self.energy_threshold)
-            wolf = Wolf(self.next_id(), (x, y), self, True, energy)
-            self.grid.place_agent(wolf, (x, y))
+    def create_wolves(self):
+        """
+        Creates the initial wolves. Energies and positions of all wolves are
+        drawn at once.
+        """
+        positions = self.random_positions(self.initial_wolves)
+        energies = self.rng.uniform(
+            self.energy_threshold,
+            2 * self.energy_threshold,
+            size=self.initial_wolves
+        )
+        for pos, energy in zip(positions, energies.tolist()):
+            wolf = Wolf(self.next_id(), pos, self, True, energy)
+            self.grid.place_agent(wolf, pos)
             self.schedule.add(wolf)
 
-        # Create grass patches
-        for _, x, y in self.grid.coord_iter():
-            fully_grown = self.random.choice([True, False])
+    def create_grass(self):
+        """
+        Creates the grass, either as GrassField or as a GrassPatch per cell.
+        Half of the grass is fully grown, the rest has a random countdown.
+        """
+        shape = (self.grid.width, self.grid.height)
+        fully_grown = self.rng.random(shape) < 0.5
+        countdown = np.where(
+            fully_grown,
+            self.grass_regrowth_time,
+            self.rng.integers(self.grass_regrowth_time, size=shape)
+        )
 
-            if fully_grown:
-                countdown = self.grass_regrowth_time
-            else:
-                countdown = self.random.randrange(self.grass_regrowth_time)
+        if self.grass_engine == 'array':
+            self.grass_field = GrassField(
+                self.grid.width,
+                self.grid.height,
+                self.grass_regrowth_time,
+                fully_grown,
+                countdown
+            )
+            return
 
+        # Coordinate-indexed lookup of the patches, grass_patches[x][y]
+        self.grass_patches = [
+            [None] * self.grid.height for _ in range(self.grid.width)
+        ]
+        for _, x, y in self.grid.coord_iter():
             patch = GrassPatch(
                 self.next_id(),
                 (x, y),
                 self,
-                fully_grown,
-                countdown
+                bool(fully_grown[x, y]),
+                int(countdown[x, y])
             )
             self.grid.place_agent(patch, (x, y))
             self.schedule.add(patch)
+            self.grass_patches[x][y] = patch
 
-        self.running = True
-        self.datacollector.collect(self)
+    @staticmethod
+    def spawn_seeds(seed, number):
+        """
+        Derives independent seeds, e.g. for replicates, from a single seed.
+        Args:
+            seed   (int): The seed to derive from, None for a random one.
+            number (int): The amount of seeds.
+        Returns:
+            List of integer seeds.
+        """
+        children = np.random.SeedSequence(seed).spawn(number)
+        return [
+            int(child.generate_state(1, np.uint64)[0]) for child in children
+        ]
+
+    def reseed(self, seed):
+        """
+        Replaces the random generators of the model by new ones from a seed,
+        e.g. to let forks of the same state continue differently.
+        Args:
+            seed (int): The new seed.
+        """
+        self.seed = seed
+        self._seed = seed
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed))
+
+    def checkpoint(self, path=None):
+        """
+        Returns a snapshot of the complete state of the model: the grid, all
+        agents (the wolves in packs included), the scheduler, the random
+        generators, the fitted parameters and the data collected so far. The
+        snapshot is a zlib compressed pickle.
+        Args:
+            path (str, optional): File to also write the snapshot to.
+        Returns:
+            The snapshot as bytes.
+        """
+        snapshot = zlib.compress(
+            pickle.dumps(self, pickle.HIGHEST_PROTOCOL), SNAPSHOT_LEVEL
+        )
+        if path is not None:
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(snapshot)
+        return snapshot
+
+    @classmethod
+    def restore(cls, snapshot):
+        """
+        Creates a model from a snapshot made by checkpoint(). The restored
+        model continues exactly as the model of the snapshot would have.
+        Args:
+            snapshot (bytes or str): The snapshot, or the file it was written
+                                     to.
+        Returns:
+            The restored WolfElk model.
+        """
+        if isinstance(snapshot, (str, os.PathLike)):
+            with open(snapshot, 'rb') as snapshot_file:
+                snapshot = snapshot_file.read()
+        model = pickle.loads(zlib.decompress(snapshot))
+        if not isinstance(model, cls):
+            raise TypeError("The snapshot does not hold a {} model".format(
+                cls.__name__
+            ))
+        return model
+
+    def fork(self, number, seed=None):
+        """
+        Creates independent continuations of the current state of the model,
+        e.g. to branch replicates from a burned-in state. Every fork gets
+        its own random generators, derived from the seed.
+        Args:
+            number (int): The amount of forks.
+            seed   (int, optional): Seed from which the seeds of the forks are
+                                    derived, None for a random one.
+        Returns:
+            List of WolfElk models.
+        """
+        snapshot = self.checkpoint()
+        forks = []
+        for fork_seed in self.spawn_seeds(seed, number):
+            model = self.restore(snapshot)
+            model.reseed(fork_seed)
+            forks.append(model)
+        return forks
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The lookup tables are rebuilt from the pickled fitted parameters, so
+        # the snapshot does not depend on the data file.
+        del state['elk_reproduction_table']
+        del state['elk_wolfkill_table']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.elk_reproduction_table = AgeTable(
+            self.elk_reproduction_params, self.time_per_step, minimum=0
+        )
+        self.elk_wolfkill_table = AgeTable(
+            self.elk_wolfkill_params, self.time_per_step, minimum=0.001
+        )
+        if self.profiler is not None:
+            # The wrappers of the grid operations are not pickled.
+            self.profiler.instrument_grid(self.grid)
+
+    def hunt(self):
+        """
+        Hunt phase of the packs which moved in this step. The packs hunt in
+        order of their unique_id: every pack up to size chooses at most one
+        elk per wolf in its territorium, weighted by the wolf-kill
+        probability of the age of the elk. Elk chosen by a pack earlier in
+        the order can not be chosen by a later pack. The kill probabilities
+        of all candidate elk are evaluated at once and all kills are applied
+        together. Packs which have eaten disband, the others pay their
+        upkeep.
+        """
+        packs = self.schedule.agents_by_breed[Pack]
+        # Packs which merged into another pack in this step do not hunt.
+        hunting_packs = sorted(
+            (pack for pack in self.hunting_packs if pack.unique_id in packs),
+            key=lambda pack: pack.unique_id
+        )
+        self.hunting_packs = []
+        population = self.elk_population
+
+        candidates = [
+            population.in_radius(pack.pos, self.wolf_territorium)
+            if len(pack) >= self.pack_size_threshold else []
+            for pack in hunting_packs
+        ]
+        sizes = [len(elk) for elk in candidates]
+        if sum(sizes) > 0:
+            kill_probs = np.split(
+                self.elk_wolfkill_table.values(np.concatenate(
+                    [population.ages(elk) for elk in candidates]
+                )),
+                np.cumsum(sizes)[:-1]
+            )
+
+        claimed = set()
+        meals = {}
+        killed = []
+        hunters = []
+        for index, (pack, elk) in enumerate(zip(hunting_packs, candidates)):
+            if sizes[index] == 0:
+                continue
+            ids = population.unique_ids(elk)
+            free = np.flatnonzero(
+                [elk_id not in claimed for elk_id in ids.tolist()]
+            )
+            # Eat at most one elk per wolf, otherwise as much as available
+            number = min(len(pack), len(free))
+            if number == 0:
+                continue
+            probs = kill_probs[index][free]
+            chosen = free[self.rng.choice(
+                len(free), p=probs / probs.sum(), replace=False, size=number
+            )]
+            claimed.update(ids[chosen].tolist())
+            meals[pack.unique_id] = [elk[i] for i in chosen]
+            killed.extend(meals[pack.unique_id])
+            hunters.extend([pack] * number)
+
+        if killed:
+            population.kill(killed, hunters)
+        for pack in hunting_packs:
+            if pack.unique_id in meals:
+                # Pack eats all chosen elk, pack is going to disband.
+                pack.pack_has_eaten(meals[pack.unique_id])
+            else:
+                pack.upkeep()
+
+    def update_statistics(self):
+        """
+        Computes the statistics of the current state of the model and stores
+        them in self.statistics. They are read by the DataCollector, the
+        result of step() and the web charts. Counts and averages come from the
+        running sums of the scheduler, only the packs are visited.
+        Returns:
+            Dictionary in the format:
+            {
+                'wolf': (int) amount of wolves, in packs and alone,
+                'elk' : (int) amount of elks,
+                'pack': (int) amount of packs,
+                'average_kills': (float) average kills per lone wolf,
+                'average_elk_age': (float) average age of elk
+            }
+        """
+        schedule = self.schedule
+        packs = schedule.get_breed_list(Pack)
+        wolves_in_packs = 0
+        for pack in packs:
+            wolves_in_packs += len(pack.wolves)
+
+        self.statistics = {
+            "wolf": schedule.get_breed_count(Wolf) + wolves_in_packs,
+            "elk": self.elk_population.count(),
+            "pack": len(packs),
+            "average_kills": schedule.get_average_kills(Wolf),
+            "average_elk_age": self.elk_population.average_age()
+        }
+        return self.statistics
 
     def get_wolf_breed_count(self):
         """
         Helper function to count the total wolves in the model, combining
-        wolves who are in Packs and lone wolves.
+        wolves who are in Packs and lone wolves, as counted by the last
+        update_statistics.
         """
-        wolves = self.schedule.get_breed_count(Wolf)
-        wolves += sum([
-            len(pack) for pack in self.schedule.get_breed_list(Pack)
-        ])
-        return wolves
+        return self.statistics["wolf"]
 
     def fit_elk_reproduction_chance(self):
         """
         Fits a polynomial to the elk reproduction data, used for interpolation
+        The fit is shared by all models with the same data and degree.
         Returns:
             Coefficients for polynomial.
         """
-        df = pd.read_csv('empirical_data/elk_ratesbyage.csv', sep=',')
-        all_ages = np.append([1], df['age'].values)
-        all_preg_rate = np.append([0], df['preg_rate'])/26
-
-        degree = self.polynomial_degree
-
-        params = params = np.polyfit(all_ages, all_preg_rate, deg=degree)
-
-        return params
+        fits = get_elk_fits(self.data_path, self.polynomial_degree)
+        return fits['reproduction_params']
 
     def fit_elk_age_distr(self):
         """
         Fits a polynomial to the survival rate per elk age, used for
-        interpolation.
+        interpolation. The fit is shared by all models with the same data and
+        degree.
         Returns:
             Probability distribution of elk ages
         """
-        df = pd.read_csv('empirical_data/elk_ratesbyage.csv', sep=',')
-        all_ages = np.append([1], df['age'].values)
-        all_surv_rate = np.append([0.9], df['surv_rate'].values)
-
-        # Compute share of population by age
-        all_surv_rate = all_surv_rate/sum(all_surv_rate)
-
-        degree = self.polynomial_degree
-
-        # Fit polynomial
-        params = np.polyfit(all_ages, all_surv_rate, deg=degree)
-
-        # Compute chances
-        chances = np.array([
-            sum([
-                params[i]*age**(degree-i) for i in range(degree+1)
-            ]) for age in np.arange(1, 20.01, 1/26)
-        ])
-        chances = chances/sum(chances)
-
-        return chances
+        fits = get_elk_fits(self.data_path, self.polynomial_degree)
+        return fits['age_distribution']
 
     def fit_elk_wolfkill_by_age(self):
         """
         Fits a polynomial to the data of wolf-kills per elk age, used for
-        interpolation.
+        interpolation. The fit is shared by all models with the same data and
+        degree.
         Returns:
             Coefficients for polynomial.
         """
-        df = pd.read_csv('empirical_data/elk_ratesbyage.csv', sep=',')
-        all_ages = np.append([1], df['age'].values)
-        all_perc_killed = np.append([50], (df['perc_of_killed'].values)/2)/100
-        all_surv_rate = np.append([0.9], df['surv_rate'].values)
-
-        degree = self.polynomial_degree
-        P_kill_by_wolf = 1100/1350
-
-        def bayes_func(i):
-            return (
-                (all_perc_killed[i] / all_surv_rate[i] * P_kill_by_wolf)
-                / all_surv_rate[i]
-            )
-
-        # Apply Bayes' Theorem
-        P_kill_wolf_byage = np.array([
-            bayes_func(i) for i, _ in enumerate(all_ages)
-        ])
-
-        # Fit polynomial
-        params = np.polyfit(all_ages, P_kill_wolf_byage, deg=degree)
-        return params
+        fits = get_elk_fits(self.data_path, self.polynomial_degree)
+        return fits['wolfkill_params']
 
     def step(self):
         """
@@ -254,61 +587,153 @@ class WolfElk(Model):
                 'elk' : (int) amount of elks,
                 'pack': (int) amount of packs,
                 'average_kills': (float) average kills per wolf,
-                'average_elk_age': (float) average age of elk
+                'average_elk_age': (float) average age of elk,
+                'stopped': (int) 1 if a stopping criterion ended the run in
+                           this step, else 0
             }
         """
         # Random activation by breed is set to False by default since the pack
         # agent creates trouble with the scheduler when enabled, throwing
         # KeyErrors.
-        self.schedule.step(False)
+        self.step_time = self.schedule.time
+        if self.profiler is None:
+            self.elk_population.step()
+            self.schedule.step(False)
+            self.hunt()
+            if self.grass_field is not None:
+                self.grass_field.step()
+        else:
+            self.profiled_step()
         # collect data
+        statistics = self.update_statistics()
         self.datacollector.collect(self)
+        self.check_stopping()
 
-        logging.debug(
-            [
-                self.schedule.time,
-                self.get_wolf_breed_count(),
-                self.schedule.get_breed_count(Elk),
-                self.schedule.get_breed_count(Pack),
-                self.schedule.get_average_kills(Wolf),
-                self.schedule.get_average_age(Elk)
-            ]
-        )
+        result = {"step": self.schedule.time}
+        result.update(statistics)
+        result["stopped"] = int(not self.running)
+        if self.debug:
+            logging.debug("%s", list(result.values()))
+        return result
 
-        return {
-            "step": self.schedule.time,
-            "wolf": self.get_wolf_breed_count(),
-            "elk":  self.schedule.get_breed_count(Elk),
-            "pack": self.schedule.get_breed_count(Pack),
-            "average_kills": self.schedule.get_average_kills(Wolf),
-            "average_elk_age": self.schedule.get_average_age(Elk)
-        }
+    def check_stopping(self):
+        """
+        Checks the stopping criteria on the statistics of the current step.
+        When one is met, self.running is set to False and self.stop_reason
+        to 'extinction', 'population_cap' or 'steady_state'.
+        """
+        if not self.running:
+            return
+        wolves = self.statistics["wolf"]
+        elk = self.statistics["elk"]
+        reason = None
+        if self.stop_on_extinction and (wolves == 0 or elk == 0):
+            reason = 'extinction'
+        elif self.population_cap is not None and \
+                max(wolves, elk) > self.population_cap:
+            reason = 'population_cap'
+        elif self.population_history is not None:
+            self.population_history.append((wolves, elk))
+            if len(self.population_history) == self.steady_state_window:
+                variance = np.var(self.population_history, axis=0)
+                if (variance < self.steady_state_tolerance).all():
+                    reason = 'steady_state'
+
+        if reason is not None:
+            self.running = False
+            self.stop_reason = reason
+            logging.info(
+                "Run stopped at step %s: %s", self.schedule.time, reason
+            )
+
+    def profiled_step(self):
+        """
+        The phases of step(), timed by the profiler.
+        """
+        profiler = self.profiler
+        with profiler.phase('elk_population'):
+            self.elk_population.step()
+        with profiler.phase('schedule'):
+            self.schedule.step(False)
+        with profiler.phase('hunt'):
+            self.hunt()
+        if self.grass_field is not None:
+            with profiler.phase('grass_field'):
+                self.grass_field.step()
+        profiler.end_step(self.schedule.time)
+
+    def get_profile_dataframe(self):
+        """
+        Returns the profile of the run as a Pandas Dataframe, with per step
+        and per breed, phase or grid operation the calls and wall time.
+        Next to datacollector.get_model_vars_dataframe().
+        """
+        if self.profiler is None:
+            raise ValueError("The model was created without profile=True")
+        return self.profiler.get_dataframe()
 
-    def run_model(self, step_count=200):
+    def run_model(self, step_count=200, sink=None):
         """
-        Runs the model.
+        Runs the model. The run ends early when a stopping criterion is met;
+        the last row then has stopped=1 and the reason is in
+        self.stop_reason (and in the attrs of the Dataframe).
         Args:
-            step_count (int, optional): The amount of steps to simulate.
+            step_count (int, optional): The maximum amount of steps to
+                                        simulate.
+            sink (ResultSink, optional): Sink to which the result of every
+                                         step is written, instead of keeping
+                                         the results in memory.
         Returns:
-            Pandas Dataframe with values.
+            Pandas Dataframe with values, or None when a sink is given.
         """
         logging.info(
             "Initial number wolves: %s", self.schedule.get_breed_count(Wolf)
         )
         logging.info(
-            "Initial number elk: %s", self.schedule.get_breed_count(Elk)
+            "Initial number elk: %s", self.elk_population.count()
         )
 
         result_dicts = []
 
         for _ in range(step_count):
+            # A restored model may already be stopped.
+            if not self.running:
+                break
             result = self.step()
-            result_dicts.append(result)
+            if sink is None:
+                result_dicts.append(result)
+            else:
+                sink.write(result)
 
         logging.info(
             "Final number wolves: %s", self.schedule.get_breed_count(Wolf)
         )
         logging.info(
-            "Final number elk: %s", self.schedule.get_breed_count(Elk)
+            "Final number elk: %s", self.elk_population.count()
         )
-        return pd.DataFrame(result_dicts)
+        if sink is not None:
+            sink.close()
+            return None
+        results = pd.DataFrame(result_dicts)
+        results.attrs['stop_reason'] = self.stop_reason
+        return results
+
+
+def report_wolves(model):
+    return model.statistics["wolf"]
+
+
+def report_elks(model):
+    return model.statistics["elk"]
+
+
+def report_elks_age(model):
+    return model.statistics["average_elk_age"]
+
+
+def report_kills(model):
+    return model.statistics["average_kills"]
+
+
+def report_packs(model):
+    return model.statistics["pack"]
@@ -0,0 +1,121 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Profiler of the steps of a model run. It records per step the
+             wall time and calls of the step() of every breed, the time of the
+             phases of the model step which are not agents (the elk herd, the
+             hunt and the grass field) and the amount of grid operations.
+             The profiler only exists when a model is constructed with
+             profile=True; without it the scheduler and the grid run
+             unchanged.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+
+import pandas as pd
+
+
+class StepProfiler():
+    """
+    Records the time and calls of breeds, phases and grid operations per
+    step.
+    """
+    # Kinds of records
+    BREED = 'breed'
+    PHASE = 'phase'
+    GRID = 'grid'
+
+    # Methods of the grid whose calls are counted.
+    GRID_OPERATIONS = (
+        'get_neighbors', 'get_neighborhood', 'get_breed_neighbors',
+        'get_breed_cell_contents', 'move_agent', 'place_agent',
+        'remove_agent'
+    )
+
+    def __init__(self):
+        self.records = []
+        # (kind, name) -> [seconds, calls] in the current step
+        self.current = defaultdict(lambda: [0.0, 0])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['current'] = dict(self.current)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.current = defaultdict(lambda: [0.0, 0], self.current)
+
+    def add(self, kind, name, seconds):
+        """
+        Adds a single call to the current step.
+        Args:
+            kind     (str): The kind, e.g. StepProfiler.BREED.
+            name     (str): Name of the breed, phase or grid operation.
+            seconds (float): Wall time of the call.
+        """
+        timing = self.current[(kind, name)]
+        timing[0] += seconds
+        timing[1] += 1
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager which times a phase of the model step.
+        Args:
+            name (str): Name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.PHASE, name, time.perf_counter() - start)
+
+    def instrument_grid(self, grid):
+        """
+        Counts and times the grid operations by wrapping the methods of this
+        grid object. The class of the grid is not changed.
+        Args:
+            grid (MultiGrid): The grid of the model.
+        """
+        for name in self.GRID_OPERATIONS:
+            method = getattr(grid, name, None)
+            if method is not None:
+                setattr(grid, name, self.counted(name, method))
+
+    def counted(self, name, method):
+        """
+        Returns a wrapper of a grid method which records its calls.
+        """
+        def counted_method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(self.GRID, name, time.perf_counter() - start)
+        return counted_method
+
+    def end_step(self, step):
+        """
+        Stores the records of the current step.
+        Args:
+            step (int): The number of the step.
+        """
+        for (kind, name), (seconds, calls) in self.current.items():
+            self.records.append((step, kind, name, calls, seconds))
+        self.current.clear()
+
+    def get_dataframe(self):
+        """
+        Returns the records as a Pandas Dataframe with the columns step,
+        kind, name, calls and seconds.
+        """
+        return pd.DataFrame(
+            self.records, columns=['step', 'kind', 'name', 'calls', 'seconds']
+        )
@@ -10,10 +10,14 @@ DESCRIPTION:The scheduler which supports random activation and random
             activation by breed. This code is partially from Mesa Examples:
             https://github.com/projectmesa/mesa/tree/master/examples/wolf_sheep
             with the addition of helper functions to get statistics of the
-            agents.
+            agents. The scheduler keeps running sums of the age and kills of
+            each breed, so the averages are available without a pass over
+            the agents. With a StepProfiler, the time and calls of the step()
+            of every breed are recorded.
 """
 from collections import defaultdict
 import logging
+import time
 
 from mesa.time import RandomActivation
 
@@ -25,10 +29,22 @@ class RandomActivationByBreed(RandomActivation):
 
     Assumes that all agents have a step() method.
     """
+    # Attributes of which a running sum is kept per breed, for the breeds
+    # that have them.
+    summed_attributes = ('age', 'kills')
 
-    def __init__(self, model):
+    def __init__(self, model, profiler=None):
+        """
+        Args:
+            model      (mesa.Model): The model to schedule.
+            profiler (StepProfiler, optional): Profiler which records the
+                                     step() of every agent, by breed.
+        """
         super().__init__(model)
         self.agents_by_breed = defaultdict(dict)
+        # breed -> {attribute: sum over the scheduled agents of the breed}
+        self.breed_sums = {}
+        self.profiler = profiler
 
     def add(self, agent):
         """
@@ -40,6 +56,15 @@ class RandomActivationByBreed(RandomActivation):
         agent_class = type(agent)
         self.agents_by_breed[agent_class][agent.unique_id] = agent
 
+        sums = self.breed_sums.get(agent_class)
+        if sums is None:
+            sums = self.breed_sums[agent_class] = {
+                attribute: 0 for attribute in self.summed_attributes
+                if hasattr(agent, attribute)
+            }
+        for attribute in sums:
+            sums[attribute] += getattr(agent, attribute)
+
     def remove(self, agent):
         """
         Remove all instances of a given agent from the schedule.
@@ -49,7 +74,29 @@ class RandomActivationByBreed(RandomActivation):
         del self._agents[agent.unique_id]
 
         agent_class = type(agent)
-        del self.agents_by_breed[agent_class][agent.unique_id]
+        agents = self.agents_by_breed[agent_class]
+        del agents[agent.unique_id]
+
+        sums = self.breed_sums[agent_class]
+        if agents:
+            for attribute in sums:
+                sums[attribute] -= getattr(agent, attribute)
+        else:
+            # Reset, so rounding errors do not accumulate.
+            for attribute in sums:
+                sums[attribute] = 0
+
+    def update_sum(self, agent, attribute, change):
+        """
+        Updates the running sum of an attribute after a scheduled agent
+        changed it. Agents must call this for every change of a summed
+        attribute while they are in the schedule.
+        Args:
+            agent     (Agent): The agent which changed.
+            attribute   (str): The name of the attribute.
+            change    (float): The change of the attribute.
+        """
+        self.breed_sums[type(agent)][attribute] += change
 
     def step(self, by_breed=False):
         """
@@ -64,8 +111,25 @@ class RandomActivationByBreed(RandomActivation):
                 self.step_breed(agent_class)
             self.steps += 1
             self.time += 1
-        else:
+        elif self.profiler is None:
             super().step()
+        else:
+            # Same as RandomActivation.step, with every step() timed.
+            for agent in self.agent_buffer(shuffled=True):
+                self.profiled_step(agent)
+            self.steps += 1
+            self.time += 1
+
+    def profiled_step(self, agent):
+        """
+        Runs the step of an agent and records it in the profiler.
+        """
+        start = time.perf_counter()
+        agent.step()
+        self.profiler.add(
+            self.profiler.BREED, type(agent).__name__,
+            time.perf_counter() - start
+        )
 
     def step_breed(self, breed):
         """
@@ -76,9 +140,14 @@ class RandomActivationByBreed(RandomActivation):
         """
         agent_keys = list(self.agents_by_breed[breed].keys())
         self.model.random.shuffle(agent_keys)
-        for agent_key in agent_keys:
-            logging.debug("Step breed function with breed {}".format(breed))
-            self.agents_by_breed[breed][agent_key].step()
+        if self.model.debug:
+            logging.debug("Step breed function with breed %s", breed)
+        if self.profiler is None:
+            for agent_key in agent_keys:
+                self.agents_by_breed[breed][agent_key].step()
+        else:
+            for agent_key in agent_keys:
+                self.profiled_step(self.agents_by_breed[breed][agent_key])
 
     def get_breed_count(self, breed_class):
         """
@@ -88,7 +157,7 @@ class RandomActivationByBreed(RandomActivation):
         Returns:
             Count of specified breed.
         """
-        return len(self.agents_by_breed[breed_class].values())
+        return len(self.agents_by_breed[breed_class])
 
     def get_breed_list(self, breed_class):
         """
@@ -109,8 +178,7 @@ class RandomActivationByBreed(RandomActivation):
         """
         agents = self.agents_by_breed[breed_class]
         if agents:
-            age_list = [agent.age for agent in agents.values()]
-            return sum(age_list) / len(agents)
+            return self.breed_sums[breed_class]['age'] / len(agents)
         else:
             return 0
 
@@ -126,7 +194,6 @@ class RandomActivationByBreed(RandomActivation):
         """
         agents = self.agents_by_breed[breed_class]
         if agents:
-            age_list = [agent.kills for agent in agents.values()]
-            return sum(age_list) / len(agents)
+            return self.breed_sums[breed_class]['kills'] / len(agents)
         else:
             return 0
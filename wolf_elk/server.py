@@ -19,6 +19,37 @@ from mesa.visualization.UserParam import UserSettableParameter
 from .wolf import Wolf, Pack
 from .agents import Elk, GrassPatch
 from .model import WolfElk
+from .herd import ElkHerd
+
+
+def grass_portrayal(fully_grown):
+    """
+    Portrayal of a single cell of grass.
+    Args:
+        fully_grown (bool): Whether the grass is fully grown.
+    """
+    portrayal = {}
+    if fully_grown:
+        portrayal["Color"] = ["#00FF00", "#00CC00", "#009900"]
+    else:
+        portrayal["Color"] = ["#84e184", "#adebad", "#d6f5d6"]
+    portrayal["Shape"] = "rect"
+    portrayal["Filled"] = "true"
+    portrayal["Layer"] = 0
+    portrayal["w"] = 1
+    portrayal["h"] = 1
+    return portrayal
+
+
+def elk_portrayal():
+    """
+    Portrayal of a single elk.
+    """
+    return {
+        "Shape": "wolf_elk/resources/elk.png",
+        "scale": 0.9,
+        "Layer": 1
+    }
 
 
 def wolf_elk_portrayal(agent):
@@ -28,9 +59,7 @@ def wolf_elk_portrayal(agent):
     portrayal = {}
 
     if type(agent) is Elk:
-        portrayal["Shape"] = "wolf_elk/resources/elk.png"
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 1
+        portrayal = elk_portrayal()
 
     if type(agent) is Pack:
         portrayal["Shape"] = "wolf_elk/resources/pack.png"
@@ -45,20 +74,37 @@ def wolf_elk_portrayal(agent):
         portrayal["text_color"] = "White"
 
     elif type(agent) is GrassPatch:
-        if agent.fully_grown:
-            portrayal["Color"] = ["#00FF00", "#00CC00", "#009900"]
-        else:
-            portrayal["Color"] = ["#84e184", "#adebad", "#d6f5d6"]
-        portrayal["Shape"] = "rect"
-        portrayal["Filled"] = "true"
-        portrayal["Layer"] = 0
-        portrayal["w"] = 1
-        portrayal["h"] = 1
+        portrayal = grass_portrayal(agent.fully_grown)
 
     return portrayal
 
 
-canvas_element = CanvasGrid(wolf_elk_portrayal, 40, 40, 1000, 1000)
+class WolfElkCanvasGrid(CanvasGrid):
+    """
+    CanvasGrid which also draws the layers of the model which are not stored
+    as agents on the grid, such as the array-backed GrassField.
+    """
+    def render(self, model):
+        grid_state = super().render(model)
+        if model.grass_field is not None:
+            for x in range(model.grid.width):
+                for y in range(model.grid.height):
+                    portrayal = grass_portrayal(
+                        model.grass_field.is_fully_grown((x, y))
+                    )
+                    portrayal["x"] = x
+                    portrayal["y"] = y
+                    grid_state[portrayal["Layer"]].append(portrayal)
+        if isinstance(model.elk_population, ElkHerd):
+            herd = model.elk_population
+            for index in herd.alive.nonzero()[0]:
+                portrayal = elk_portrayal()
+                portrayal["x"], portrayal["y"] = herd.position(index)
+                grid_state[portrayal["Layer"]].append(portrayal)
+        return grid_state
+
+
+canvas_element = WolfElkCanvasGrid(wolf_elk_portrayal, 40, 40, 1000, 1000)
 
 chart_element = ChartModule(
     [
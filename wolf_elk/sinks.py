@@ -0,0 +1,299 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Sinks to which the results of model runs are streamed step by
+             step, instead of collecting them in a DataFrame in memory. A sink
+             buffers rows and writes them in chunks to a CSV-file, a directory
+             of Parquet-files or a NumPy .npy-file. Sinks hold no open files
+             between flushes, so the same sink can be passed to worker
+             processes which all append to the same output:
+
+             CSVSink:     Appends to a single CSV-file, chunks are written
+                          under a file lock.
+             ParquetSink: Every process writes its own part file in a
+                          directory, which is read back as one table.
+                          Requires pyarrow.
+             NpySink:     A preallocated .npy-file with a structured dtype,
+                          every replicate writes its own block of rows through
+                          a memory map.
+"""
+from copy import copy
+import csv
+import glob
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .files import lock_file, unlock_file
+
+# Columns of the results of a model run, as returned by WolfElk.step, with
+# the replicate number in front.
+RESULT_COLUMNS = (
+    'replicate', 'step', 'wolf', 'elk', 'pack', 'average_kills',
+    'average_elk_age', 'stopped'
+)
+
+
+class ResultSink():
+    """
+    Base class of the sinks. Subclasses implement write_chunk and read.
+    """
+    def __init__(self, columns=RESULT_COLUMNS, chunk_size=1000):
+        """
+        Args:
+            columns   (tuple, optional): The columns to write.
+            chunk_size  (int, optional): The amount of rows to buffer before
+                                         they are written.
+        """
+        self.columns = tuple(columns)
+        self.chunk_size = chunk_size
+        self.replicate_number = 0
+        self.buffer = []
+
+    def for_replicate(self, number):
+        """
+        Returns a copy of the sink for a single replicate, which writes the
+        replicate number in the 'replicate' column of every row.
+        Args:
+            number (int): The number of the replicate.
+        """
+        sink = copy(self)
+        sink.replicate_number = number
+        sink.buffer = []
+        return sink
+
+    def write(self, row):
+        """
+        Adds a row to the sink and writes the buffer when it is full.
+        Args:
+            row (dict): Values per column, missing columns are left empty.
+        """
+        row = dict(row, replicate=self.replicate_number)
+        self.buffer.append(tuple(row.get(column) for column in self.columns))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows.
+        """
+        if self.buffer:
+            self.write_chunk(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        """
+        Writes the remaining rows. The sink can still be written to after.
+        """
+        self.flush()
+
+    def write_chunk(self, rows):
+        raise NotImplementedError
+
+    def read(self):
+        """
+        Returns all rows written to the sink as a Pandas Dataframe.
+        """
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getstate__(self):
+        # Buffered rows stay in the process which wrote them.
+        state = self.__dict__.copy()
+        state['buffer'] = []
+        return state
+
+
+class CSVSink(ResultSink):
+    """
+    Sink which appends to a single CSV-file. The header is written by the
+    first writer of an empty file.
+    """
+    def __init__(self, path, columns=RESULT_COLUMNS, chunk_size=1000,
+                 append=False):
+        """
+        Args:
+            path          (str): The CSV-file to write to.
+            columns   (tuple, optional): The columns to write.
+            chunk_size  (int, optional): Rows to buffer before writing.
+            append     (bool, optional): Whether to keep the rows already in
+                                         the file, otherwise it is emptied.
+        """
+        super().__init__(columns, chunk_size)
+        self.path = path
+        if not append:
+            open(path, 'w').close()
+
+    def write_chunk(self, rows):
+        with open(self.path, 'a', newline='') as output:
+            lock_file(output)
+            try:
+                writer = csv.writer(output)
+                output.seek(0, os.SEEK_END)
+                if output.tell() == 0:
+                    writer.writerow(self.columns)
+                writer.writerows(rows)
+                output.flush()
+            finally:
+                unlock_file(output)
+
+    def read(self):
+        return pd.read_csv(self.path, float_precision='round_trip')
+
+
+class ParquetSink(ResultSink):
+    """
+    Sink which writes a directory of Parquet-files. Every process writes its
+    own part file, with a row group per chunk.
+    """
+    def __init__(self, directory, columns=RESULT_COLUMNS, chunk_size=10000,
+                 append=False):
+        """
+        Args:
+            directory     (str): The directory to write the part files to.
+            columns   (tuple, optional): The columns to write.
+            chunk_size  (int, optional): Rows to buffer before writing.
+            append     (bool, optional): Whether to keep the part files
+                                         already in the directory.
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("ParquetSink requires the pyarrow package")
+        super().__init__(columns, chunk_size)
+        self.directory = directory
+        self.writer = None
+        self.writer_pid = None
+        os.makedirs(directory, exist_ok=True)
+        if not append:
+            for part in glob.glob(os.path.join(directory, '*.parquet')):
+                os.remove(part)
+
+    def write_chunk(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # All columns are stored as float64, as in NpySink, so the schema of
+        # every chunk is the same even when a column is empty.
+        schema = pa.schema([(column, pa.float64()) for column in self.columns])
+        table = pa.Table.from_pylist(
+            [dict(zip(self.columns, row)) for row in rows], schema=schema
+        )
+        if self.writer is None or self.writer_pid != os.getpid():
+            path = os.path.join(
+                self.directory,
+                'part-{}-{}.parquet'.format(os.getpid(), uuid.uuid4().hex)
+            )
+            self.writer = pq.ParquetWriter(path, schema)
+            self.writer_pid = os.getpid()
+        self.writer.write_table(table)
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the part file of this process.
+        """
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def read(self):
+        return pd.read_parquet(self.directory)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['writer'] = None
+        state['writer_pid'] = None
+        return state
+
+
+class NpySink(ResultSink):
+    """
+    Sink which writes to a preallocated .npy-file with a field per column.
+    The rows of replicate r start at row r * rows_per_replicate. Rows which
+    are never written stay NaN.
+    """
+    def __init__(self, path, rows_per_replicate, replicates=1,
+                 columns=RESULT_COLUMNS, chunk_size=1000, append=False):
+        """
+        Args:
+            path                (str): The .npy-file to write to.
+            rows_per_replicate  (int): Rows reserved per replicate, usually
+                                       the step count.
+            replicates          (int, optional): The amount of replicates.
+            columns           (tuple, optional): The columns to write.
+            chunk_size          (int, optional): Rows to buffer before
+                                                 writing.
+            append             (bool, optional): Whether to write into an
+                                                 existing file of the same
+                                                 shape.
+        """
+        super().__init__(columns, chunk_size)
+        self.path = path
+        self.rows_per_replicate = rows_per_replicate
+        self.rows_written = 0
+        self.dtype = np.dtype([(column, 'f8') for column in self.columns])
+        shape = (rows_per_replicate * replicates,)
+        if append and os.path.exists(path):
+            existing = np.load(path, mmap_mode='r')
+            if existing.shape != shape or existing.dtype != self.dtype:
+                raise ValueError(
+                    "Existing file {} does not match the sink".format(path)
+                )
+        else:
+            array = np.lib.format.open_memmap(
+                path, mode='w+', dtype=self.dtype, shape=shape
+            )
+            array.view((np.float64, len(self.columns)))[:] = np.nan
+            array.flush()
+            del array
+
+    def for_replicate(self, number):
+        sink = super().for_replicate(number)
+        sink.rows_written = 0
+        return sink
+
+    def write_chunk(self, rows):
+        start = (
+            self.replicate_number * self.rows_per_replicate + self.rows_written
+        )
+        if self.rows_written + len(rows) > self.rows_per_replicate:
+            raise ValueError(
+                "More than {} rows written for replicate {}".format(
+                    self.rows_per_replicate, self.replicate_number
+                )
+            )
+        array = np.load(self.path, mmap_mode='r+')
+        array[start:start + len(rows)] = np.array(
+            [tuple(np.nan if v is None else v for v in row) for row in rows],
+            dtype=self.dtype
+        )
+        array.flush()
+        del array
+        self.rows_written += len(rows)
+
+    def load(self):
+        """
+        Returns the rows as a read-only memory mapped structured array.
+        """
+        return np.load(self.path, mmap_mode='r')
+
+    def read(self):
+        """
+        Returns the rows as a Pandas Dataframe, without the rows which were
+        never written.
+        """
+        data = pd.DataFrame(self.load())
+        return data.dropna(how='all').reset_index(drop=True)
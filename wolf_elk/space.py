@@ -0,0 +1,177 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: MultiGrid with a spatial index per breed. Next to the cell
+             contents, the grid keeps for every agent class the occupied cells
+             and the agents of that class in them. Queries for agents of one
+             type in a radius then only touch agents of that type, instead of
+             every agent (grass patches included) in the neighborhood.
+             The Moore neighborhood offsets per radius, used by the ElkHerd,
+             are computed once per process and shared.
+"""
+from collections import defaultdict
+
+from mesa.space import MultiGrid
+import numpy as np
+
+# (radius, include_center) -> (dx, dy) arrays of the Moore neighborhood
+_moore_offsets = {}
+
+
+def moore_offsets(radius, include_center=False):
+    """
+    Returns the (dx, dy) offsets of the Moore neighborhood of a radius, as
+    read-only arrays.
+    """
+    key = (radius, include_center)
+    offsets = _moore_offsets.get(key)
+    if offsets is None:
+        steps = np.arange(-radius, radius + 1)
+        dx, dy = np.meshgrid(steps, steps, indexing='ij')
+        dx = dx.ravel()
+        dy = dy.ravel()
+        if not include_center:
+            keep = (dx != 0) | (dy != 0)
+            dx = dx[keep]
+            dy = dy[keep]
+        dx.setflags(write=False)
+        dy.setflags(write=False)
+        offsets = _moore_offsets[key] = (dx, dy)
+    return offsets
+
+
+class BreedGrid(MultiGrid):
+    """
+    MultiGrid which maintains a per-breed index of the occupied cells. A breed
+    is the class of an agent, as in RandomActivationByBreed.
+    """
+
+    def __init__(self, width, height, torus):
+        """
+        Create a new grid.
+        Args:
+            width  (int): Width of the grid
+            height (int): Height of the grid
+            torus (bool): Whether the edges of the grid wrap around.
+        """
+        super().__init__(width, height, torus)
+        # breed -> {pos: [agents of that breed in the cell]}
+        self.breed_cells = defaultdict(dict)
+
+    def __getstate__(self):
+        # Methods wrapped on this object, e.g. by a StepProfiler, are not
+        # pickled; the class methods are used after unpickling.
+        return {
+            name: value for name, value in self.__dict__.items()
+            if not (callable(value) and hasattr(type(self), name))
+        }
+
+    def _place_agent(self, pos, agent):
+        """
+        Place the agent at the correct location and add it to the index.
+        """
+        super()._place_agent(pos, agent)
+        cells = self.breed_cells[type(agent)]
+        cell = cells.get(pos)
+        if cell is None:
+            cells[pos] = [agent]
+        elif agent not in cell:
+            cell.append(agent)
+
+    def _remove_agent(self, pos, agent):
+        """
+        Remove the agent from the given location and from the index.
+        """
+        super()._remove_agent(pos, agent)
+        cells = self.breed_cells[type(agent)]
+        cell = cells[pos]
+        cell.remove(agent)
+        if not cell:
+            del cells[pos]
+
+    def get_breed_cell_contents(self, pos, breed):
+        """
+        Returns the agents of a breed in a single cell.
+        Args:
+            pos  (tuple): The coordinates of the cell.
+            breed (class): The class of the agents.
+        Returns:
+            List of agents.
+        """
+        return list(self.breed_cells[breed].get(pos, ()))
+
+    def get_breed_neighbors(self, pos, breed, radius=1, include_center=False):
+        """
+        Returns the agents of a breed in the Moore neighborhood of a cell.
+        Gives the same agents as filtering get_neighbors(pos, True,
+        include_center, radius) on the breed, except that without
+        include_center the center cell is also left out when the neighborhood
+        wraps around onto it (2 * radius + 1 larger than the grid).
+        Args:
+            pos             (tuple): The coordinates of the center cell.
+            breed           (class): The class of the agents.
+            radius            (int): Radius of the neighborhood.
+            include_center   (bool): Whether to include the center cell.
+        Returns:
+            List of agents.
+        """
+        cells = self.breed_cells[breed]
+        if not cells:
+            return []
+
+        neighbors = []
+        if len(cells) < (2 * radius + 1) ** 2:
+            # Fewer occupied cells than cells in the neighborhood: check the
+            # distance to each occupied cell.
+            x, y = pos
+            for (cx, cy), agents in cells.items():
+                dx = abs(cx - x)
+                dy = abs(cy - y)
+                if self.torus:
+                    dx = min(dx, self.width - dx)
+                    dy = min(dy, self.height - dy)
+                if dx > radius or dy > radius:
+                    continue
+                if dx == 0 and dy == 0 and not include_center:
+                    continue
+                neighbors.extend(agents)
+        else:
+            for cell in self.iter_neighborhood(
+                pos, True, include_center, radius
+            ):
+                if cell == pos and not include_center:
+                    # Reached through the wrap around.
+                    continue
+                agents = cells.get(cell)
+                if agents:
+                    neighbors.extend(agents)
+        return neighbors
+
+    def get_closest_agent(self, pos, agents):
+        """
+        Returns the agent closest to a cell, by the Euclidean distance on the
+        grid (wrapping around the edges if the grid is a torus). Of agents at
+        the same distance, the one with the lowest unique_id is returned.
+        Args:
+            pos   (tuple): The coordinates of the cell.
+            agents (list): The agents to choose from.
+        Returns:
+            The closest agent, or None if agents is empty.
+        """
+        if len(agents) < 2:
+            return agents[0] if len(agents) else None
+
+        positions = np.array([agent.pos for agent in agents])
+        delta = np.abs(positions - pos)
+        if self.torus:
+            delta = np.minimum(delta, (self.width, self.height) - delta)
+        distance = (delta * delta).sum(axis=1)
+        closest = np.flatnonzero(distance == distance.min())
+        if len(closest) == 1:
+            return agents[closest[0]]
+        return min((agents[i] for i in closest), key=lambda a: a.unique_id)
@@ -0,0 +1,419 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Binary columnar store for the results of replicates and
+             sensitivity analyses. A store is a directory with a typed
+             .npy-file per column, which are loaded as memory maps, and an
+             index of the distinct parameter vectors of the rows:
+
+             <path>/meta.json             Names of the parameter columns.
+             <path>/CURRENT               Name of the current generation.
+             <path>/generations/<gen>/    The compacted rows: a <col>.npy
+                                          per column, parameters.npy with
+                                          the distinct parameter vectors
+                                          (the column param_id refers to
+                                          its rows) and merged.json with
+                                          the chunks merged into it.
+             <path>/chunks/<chunk>/       Rows appended since the last
+                                          compaction, a <col>.npy per
+                                          column.
+
+             Appends from many processes each write their own chunk, which is
+             moved into place atomically. Chunks are merged by compact(),
+             which load() does when needed. A compaction writes a new
+             generation and publishes it by replacing CURRENT, so readers see
+             either the old or the new rows, never a mix. Chunks listed in
+             merged.json of the current generation are never merged again.
+             Compactions hold an exclusive and reads a shared lock on
+             <path>/store.lock.
+"""
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import quote, unquote
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .files import atomic_write, locked
+from .sinks import ResultSink, RESULT_COLUMNS
+
+
+class ResultStore():
+    """
+    A directory of typed columns, appended to in chunks and loaded as
+    memory mapped arrays.
+    """
+    def __init__(self, path, parameter_names=()):
+        """
+        Opens the store at the path, or creates it.
+        Args:
+            path                   (str): The directory of the store.
+            parameter_names (list, optional): The columns which hold the model
+                                         parameters, used for the parameter
+                                         index. Must match the names of an
+                                         existing store.
+        """
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                stored_names = json.load(meta_file)['parameter_names']
+            if parameter_names and list(parameter_names) != stored_names:
+                raise ValueError(
+                    "Store {} has parameters {}".format(path, stored_names)
+                )
+            self.parameter_names = stored_names
+        else:
+            self.parameter_names = list(parameter_names)
+            os.makedirs(os.path.join(path, 'generations'), exist_ok=True)
+            os.makedirs(os.path.join(path, 'chunks'), exist_ok=True)
+            with open(meta_path, 'w') as meta_file:
+                json.dump({'parameter_names': self.parameter_names}, meta_file)
+
+    @classmethod
+    def from_csv(cls, csv_path, path, parameter_names=()):
+        """
+        Creates a store from a csv-file, e.g. an existing result file. An
+        unnamed index column written by Pandas is dropped.
+        Args:
+            csv_path                (str): The csv-file to import.
+            path                    (str): The directory of the new store.
+            parameter_names (list, optional): The parameter columns.
+        Returns:
+            The ResultStore.
+        """
+        data = pd.read_csv(csv_path, float_precision='round_trip')
+        data = data.drop(
+            columns=[c for c in data.columns if c.startswith('Unnamed:')]
+        )
+        store = cls(path, parameter_names)
+        store.append({name: data[name].values for name in data.columns})
+        store.compact()
+        return store
+
+    def append(self, rows):
+        """
+        Appends rows to the store as a new chunk.
+        Args:
+            rows (list or dict): A list of dictionaries, one per row, or a
+                                 dictionary with an array per column.
+        """
+        if isinstance(rows, dict):
+            columns = {name: np.asarray(v) for name, v in rows.items()}
+        else:
+            if not rows:
+                return
+            columns = {
+                name: column_array([row.get(name) for row in rows])
+                for name in rows[0]
+            }
+        chunks = os.path.join(self.path, 'chunks')
+        # Chunks are named by time, so they are compacted in order of append.
+        name = '{:020d}-{}-{}'.format(
+            time.time_ns(), os.getpid(), uuid.uuid4().hex
+        )
+        staging = tempfile.mkdtemp(dir=chunks, prefix='.')
+        for column, values in columns.items():
+            np.save(column_file(staging, column), values)
+        os.rename(staging, os.path.join(chunks, name))
+
+    def pending_chunks(self):
+        """
+        Returns the directories of the chunks which are not yet compacted.
+        """
+        merged = self.merged_chunks()
+        return [
+            chunk for chunk in sorted(
+                glob.glob(os.path.join(self.path, 'chunks', '[0-9]*'))
+            )
+            if os.path.basename(chunk) not in merged
+        ]
+
+    def current_generation(self):
+        """
+        Returns the directory of the current generation of the compacted
+        rows, or None when nothing is compacted yet.
+        """
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as current:
+                name = current.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.path, 'generations', name)
+
+    def merged_chunks(self):
+        """
+        Returns the names of the chunks merged into the current generation.
+        """
+        generation = self.current_generation()
+        if generation is None:
+            return set()
+        try:
+            with open(os.path.join(generation, 'merged.json')) as merged_file:
+                return set(json.load(merged_file))
+        except FileNotFoundError:
+            # Replaced by a compaction since CURRENT was read.
+            return set()
+
+    def compact(self, sort_by=None):
+        """
+        Merges the pending chunks into a new generation of the compacted
+        rows and rebuilds the parameter index.
+        Args:
+            sort_by (str, optional): Column to sort all rows by, e.g. 'Run'.
+        """
+        with locked(self.lock_path()):
+            self.remove_stale()
+            chunks = self.pending_chunks()
+            if not chunks and sort_by is None:
+                return
+
+            parts = [self.read_generation(mmap=False)]
+            for chunk in chunks:
+                parts.append({
+                    column_name(f): np.load(f)
+                    for f in glob.glob(os.path.join(chunk, '*.npy'))
+                })
+            names = []
+            for part in parts:
+                names.extend(n for n in part if n not in names)
+            length = [
+                len(next(iter(part.values()))) if part else 0
+                for part in parts
+            ]
+            columns = {}
+            for name in names:
+                columns[name] = np.concatenate([
+                    part[name] if name in part
+                    else np.full(size, np.nan)
+                    for part, size in zip(parts, length) if size
+                ] or [part[name] for part in parts if name in part])
+            columns.pop('param_id', None)
+            if sort_by is not None and sort_by in columns:
+                order = np.argsort(columns[sort_by], kind='stable')
+                columns = {name: v[order] for name, v in columns.items()}
+
+            generations = os.path.join(self.path, 'generations')
+            staging = tempfile.mkdtemp(dir=generations, prefix='.')
+            self.write_columns(staging, columns)
+            with open(os.path.join(staging, 'merged.json'), 'w') as merged:
+                json.dump([os.path.basename(c) for c in chunks], merged)
+            name = '{:020d}-{}'.format(time.time_ns(), uuid.uuid4().hex)
+            os.rename(staging, os.path.join(generations, name))
+            with atomic_write(os.path.join(self.path, 'CURRENT')) as current:
+                current.write(name.encode())
+            self.remove_stale()
+
+    def remove_stale(self):
+        """
+        Removes the chunks which are merged into the current generation and
+        the other generations, e.g. left behind by an interrupted compaction.
+        Only called with the exclusive lock held.
+        """
+        for chunk in self.merged_chunks():
+            shutil.rmtree(
+                os.path.join(self.path, 'chunks', chunk), ignore_errors=True
+            )
+        generations = os.path.join(self.path, 'generations')
+        current = self.current_generation()
+        for name in os.listdir(generations):
+            generation = os.path.join(generations, name)
+            if generation != current:
+                shutil.rmtree(generation, ignore_errors=True)
+
+    def write_columns(self, directory, columns):
+        """
+        Writes the column files and the parameter index to a directory.
+        """
+        if self.parameter_names and columns:
+            vectors = np.column_stack([
+                np.asarray(columns[name], dtype=float)
+                for name in self.parameter_names
+            ])
+            vectors, param_id = np.unique(vectors, axis=0, return_inverse=True)
+            columns['param_id'] = param_id.reshape(-1).astype(np.int64)
+            np.save(os.path.join(directory, 'parameters.npy'), vectors)
+        for name, values in columns.items():
+            np.save(column_file(directory, name), values)
+
+    def read_generation(self, columns=None, mmap=True):
+        """
+        Returns the columns of the current generation as a dictionary of
+        arrays. Only called with the lock held.
+        """
+        generation = self.current_generation()
+        if generation is None:
+            return {}
+        data = {}
+        for f in sorted(glob.glob(os.path.join(generation, '*.npy'))):
+            name = column_name(f)
+            if name == 'parameters':
+                continue
+            if columns is None or name in columns:
+                data[name] = np.load(f, mmap_mode='r' if mmap else None)
+        return data
+
+    def read_parameters(self):
+        """
+        Returns the distinct parameter vectors of the current generation.
+        Only called with the lock held.
+        """
+        generation = self.current_generation()
+        if generation is None:
+            return np.empty((0, len(self.parameter_names)))
+        return np.load(os.path.join(generation, 'parameters.npy'))
+
+    def lock_path(self):
+        return os.path.join(self.path, 'store.lock')
+
+    def load_columns(self, columns=None, mmap=True):
+        """
+        Returns the compacted columns as a dictionary of arrays, without
+        compacting pending chunks.
+        """
+        with locked(self.lock_path(), shared=True):
+            return self.read_generation(columns, mmap)
+
+    def load(self, columns=None, mmap=True):
+        """
+        Returns the columns of all rows as a dictionary of arrays. Pending
+        chunks are compacted first.
+        Args:
+            columns (list, optional): The columns to load, defaults to all.
+            mmap    (bool, optional): Whether to load the columns as read-only
+                                      memory maps.
+        """
+        if self.pending_chunks():
+            self.compact()
+        return self.load_columns(columns, mmap)
+
+    def read(self, columns=None):
+        """
+        Returns the rows as a Pandas Dataframe.
+        Args:
+            columns (list, optional): The columns to read, in this order.
+        """
+        data = self.load(columns, mmap=False)
+        frame = pd.DataFrame(data)
+        if columns is not None:
+            frame = frame[list(columns)]
+        return frame
+
+    def parameters(self):
+        """
+        Returns the distinct parameter vectors as a Dataframe indexed by
+        param_id.
+        """
+        if not self.parameter_names:
+            raise ValueError("Store {} has no parameter columns".format(
+                self.path
+            ))
+        if self.pending_chunks():
+            self.compact()
+        with locked(self.lock_path(), shared=True):
+            vectors = self.read_parameters()
+        return pd.DataFrame(vectors, columns=self.parameter_names)
+
+    def rows_for(self, parameters):
+        """
+        Returns the indices of the rows with the given parameter values.
+        Args:
+            parameters (dict): Values of all parameter columns.
+        """
+        if not self.parameter_names:
+            raise ValueError("Store {} has no parameter columns".format(
+                self.path
+            ))
+        if self.pending_chunks():
+            self.compact()
+        # The index and the rows are read from the same generation.
+        with locked(self.lock_path(), shared=True):
+            vectors = self.read_parameters()
+            param_id = self.read_generation(['param_id'], mmap=False).get(
+                'param_id'
+            )
+        target = [float(parameters[name]) for name in self.parameter_names]
+        matches = np.flatnonzero((vectors == target).all(axis=1))
+        if len(matches) == 0 or param_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(param_id == matches[0])
+
+    def __len__(self):
+        data = self.load()
+        return len(next(iter(data.values()))) if data else 0
+
+    def sink(self, parameters=None, columns=RESULT_COLUMNS, chunk_size=1000):
+        """
+        Returns a sink which writes to this store, e.g. for Runner.run.
+        Args:
+            parameters (dict, optional): Values written in the parameter
+                                         columns of every row.
+            columns   (tuple, optional): The result columns to write.
+            chunk_size  (int, optional): Rows to buffer before writing.
+        """
+        return StoreSink(self, parameters, columns, chunk_size)
+
+
+class StoreSink(ResultSink):
+    """
+    Sink which appends the rows to a ResultStore, together with the values
+    of the parameter columns.
+    """
+    def __init__(self, store, parameters=None, columns=RESULT_COLUMNS,
+                 chunk_size=1000):
+        parameters = dict(parameters or {})
+        super().__init__(tuple(columns) + tuple(
+            name for name in store.parameter_names if name not in columns
+        ), chunk_size)
+        self.store = store
+        self.parameters = parameters
+
+    def write(self, row):
+        super().write(dict(self.parameters, **row))
+
+    def write_chunk(self, rows):
+        self.store.append({
+            name: column_array([row[i] for row in rows])
+            for i, name in enumerate(self.columns)
+        })
+
+    def read(self):
+        return self.store.read()
+
+
+def column_file(directory, name):
+    """
+    Returns the path of the .npy-file of a column. Characters which can not
+    be used in a file name, such as the '/' in 'Killed Elks/Wolf', are
+    escaped.
+    """
+    return os.path.join(directory, quote(name, safe=' ') + '.npy')
+
+
+def column_name(path):
+    """
+    Returns the column name of a .npy-file written by column_file.
+    """
+    return unquote(os.path.basename(path)[:-len('.npy')])
+
+
+def column_array(values):
+    """
+    Converts a list of values to a typed column, missing values become NaN.
+    """
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = np.array(
+            [np.nan if v is None else v for v in values], dtype=float
+        )
+    return array
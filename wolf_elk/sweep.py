@@ -0,0 +1,157 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Parameter sweeps over WolfElk. A sweep runs every replicate of
+             every parameter set in a process pool, with run_replicate, the
+             same function Runner uses for the replicates of a single
+             parameter set. The results are returned as a long-format table
+             with a row per parameter set, replicate, step and variable, or
+             are streamed to a ResultStore.
+
+             Example:
+             run_sweep(
+                 {'initial_wolves': [10, 20], 'wolf_territorium': [2, 8]},
+                 replicates=5, step_count=200, workers=4, seed=1
+             )
+"""
+from concurrent.futures import ProcessPoolExecutor
+import inspect
+from itertools import product
+
+import pandas as pd
+
+from .model import WolfElk
+
+# Default keyword arguments of WolfElk.
+MODEL_DEFAULTS = {
+    name: parameter.default
+    for name, parameter in
+    inspect.signature(WolfElk.__init__).parameters.items()
+    if parameter.default is not inspect.Parameter.empty
+}
+
+
+def expand_grid(grid):
+    """
+    Returns all combinations of the values of a parameter grid.
+    Args:
+        grid (dict): Per keyword argument of WolfElk a list of values.
+    Returns:
+        List of dictionaries with keyword arguments, the last parameter
+        varying fastest.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*grid.values())]
+
+
+def run_replicate(params, step_count, seed, sink=None, warm_start=None):
+    """
+    Runs a single replicate of the model.
+    Args:
+        params   (dict): Keyword arguments for WolfElk.
+        step_count (int): The amount of steps to simulate.
+        seed      (int): Seed of the replicate.
+        sink (ResultSink, optional): Sink to stream the results to.
+        warm_start (WarmStartCache, optional): Cache to take the burned-in
+                                               state from.
+    Returns:
+        Pandas Dataframe with the results of the replicate, or None when a
+        sink is given.
+    """
+    if warm_start is None:
+        model = WolfElk(**params, seed=seed)
+    else:
+        model = warm_start.get_model(params, seed)
+    return model.run_model(step_count - model.schedule.steps, sink=sink)
+
+
+def run_point(task):
+    """
+    Runs a single replicate of a parameter set of a sweep.
+    Args:
+        task (tuple): Index of the parameter set, replicate, keyword
+                      arguments of WolfElk, step count, seed, sink and
+                      warm-start cache, see run_replicate.
+    Returns:
+        Pandas Dataframe with the results of the run, or None when it is
+        streamed to a sink.
+    """
+    point, replicate, parameters, step_count, seed, sink, warm_start = task
+    result = run_replicate(parameters, step_count, seed, sink, warm_start)
+    if result is not None:
+        result.insert(0, 'replicate', replicate)
+        result.insert(0, 'point', point)
+    return result
+
+
+def run_sweep(parameters, replicates=1, step_count=200, workers=1, seed=None,
+              chunksize=4, store=None, warm_start=None):
+    """
+    Runs a parameter sweep.
+    Args:
+        parameters (dict or list): A parameter grid, see expand_grid, or a
+                                   list of dictionaries with keyword
+                                   arguments of WolfElk.
+        replicates     (int, optional): Replicates per parameter set.
+        step_count     (int, optional): Steps per run.
+        workers        (int, optional): The amount of processes. The result
+                                        is the same as that of a serial sweep
+                                        with the same seed.
+        seed           (int, optional): Seed from which the seeds of all runs
+                                        are derived.
+        chunksize      (int, optional): Runs sent to a worker at once.
+        store  (ResultStore, optional): Store to which every run streams its
+                                        results, with the replicate number
+                                        and the values of the parameter
+                                        columns of the store in every row.
+        warm_start (WarmStartCache, optional): Cache of burned-in states the
+                                        runs start from, see Runner.
+    Returns:
+        Pandas Dataframe in long format with the columns point (index of the
+        parameter set), replicate, the swept parameters, step, variable and
+        value, or the store when one is given.
+    """
+    if isinstance(parameters, dict):
+        parameter_sets = expand_grid(parameters)
+    else:
+        parameter_sets = [dict(parameters) for parameters in parameters]
+    names = []
+    for parameters in parameter_sets:
+        names.extend(name for name in parameters if name not in names)
+
+    seeds = WolfElk.spawn_seeds(seed, len(parameter_sets) * replicates)
+    tasks = [
+        (point, replicate, parameters, step_count,
+         seeds[replicate * len(parameter_sets) + point],
+         None if store is None
+         else store.sink(parameters).for_replicate(replicate),
+         warm_start)
+        for replicate in range(replicates)
+        for point, parameters in enumerate(parameter_sets)
+    ]
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(run_point, tasks, chunksize=chunksize))
+    else:
+        results = list(map(run_point, tasks))
+    if store is not None:
+        return store
+
+    results = pd.concat(results, ignore_index=True)
+    results = results.melt(
+        id_vars=['point', 'replicate', 'step'], var_name='variable'
+    )
+    swept = pd.DataFrame(parameter_sets, columns=names)
+    results = results.join(swept, on='point')
+    results = results[
+        ['point', 'replicate'] + names + ['step', 'variable', 'value']
+    ]
+    return results.sort_values(
+        ['point', 'replicate', 'variable', 'step'], ignore_index=True
+    )
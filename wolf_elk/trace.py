@@ -0,0 +1,61 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Structured trace of the events in a model run: births, kills and
+             the forming and disbanding of packs. The trace is only created
+             when a model is constructed with trace_events=True; agents check
+             model.trace for None before recording, so a run without trace
+             does no work for it.
+"""
+import pandas as pd
+
+
+class EventTrace():
+    """
+    Records the events of a single model run.
+    """
+    # Kinds of events which are recorded.
+    ELK_BORN = 'elk_born'
+    WOLF_BORN = 'wolf_born'
+    ELK_KILLED = 'elk_killed'
+    PACK_FORMED = 'pack_formed'
+    PACK_MERGED = 'pack_merged'
+    PACK_DISBANDED = 'pack_disbanded'
+
+    def __init__(self, model):
+        """
+        Args:
+            model (mesa.Model): The model to trace.
+        """
+        self.model = model
+        self.events = []
+
+    def record(self, kind, agent_id, pos, other_id=None):
+        """
+        Records an event at the time of the model at the start of the
+        current step (model.step_time).
+        Args:
+            kind        (str): The kind of the event, e.g. EventTrace.ELK_BORN
+            agent_id    (int): ID of the agent causing the event (the parent,
+                               the hunter or the pack).
+            pos       (tuple): Position of the event.
+            other_id    (int, optional): ID of the other agent involved (the
+                               calf, the killed elk or the merged pack).
+        """
+        self.events.append(
+            (self.model.step_time, kind, agent_id, other_id, pos)
+        )
+
+    def get_dataframe(self):
+        """
+        Returns the recorded events as a Pandas Dataframe with the columns
+        step, event, agent, other and pos.
+        """
+        return pd.DataFrame(
+            self.events, columns=['step', 'event', 'agent', 'other', 'pos']
+        )
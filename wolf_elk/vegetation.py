@@ -0,0 +1,87 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: Array-backed vegetation layer. Instead of one GrassPatch agent per
+             cell, the state of all grass on the grid is kept in two NumPy
+             arrays which are advanced with a single vectorized operation per
+             step. The regrowth rules are the same as in GrassPatch.step.
+"""
+import numpy as np
+
+
+class GrassField():
+    """
+    The grass of the whole grid, stored as arrays indexed by [x, y].
+    """
+    def __init__(self, width, height, regrowth_time, fully_grown, countdown):
+        """
+        Create a new grass layer.
+        Args:
+            width              (int): Width of the grid
+            height             (int): Height of the grid
+            regrowth_time      (int): Time for eaten grass to regrow
+            fully_grown (array-like): Initial fully grown state per cell,
+                                      shape (width, height)
+            countdown   (array-like): Initial countdown per cell, shape
+                                      (width, height)
+        """
+        self.width = width
+        self.height = height
+        self.regrowth_time = regrowth_time
+        self.fully_grown = np.array(fully_grown, dtype=bool).reshape(
+            (width, height)
+        )
+        self.countdown = np.array(countdown, dtype=np.int64).reshape(
+            (width, height)
+        )
+
+    def step(self):
+        """
+        Advances the regrowth of all grass on the grid by one step.
+        """
+        growing = ~self.fully_grown
+        regrown = growing & (self.countdown <= 0)
+        self.countdown[growing & ~regrown] -= 1
+        self.countdown[regrown] = self.regrowth_time
+        self.fully_grown |= regrown
+
+    def eat(self, pos):
+        """
+        Eats the grass at the given cell if it is fully grown.
+        Args:
+            pos (tuple): The coordinates of the cell.
+        Returns:
+            True if there was grass to eat, otherwise False.
+        """
+        x, y = pos
+        if self.fully_grown[x, y]:
+            self.fully_grown[x, y] = False
+            return True
+        return False
+
+    def eat_cells(self, cells):
+        """
+        Eats the fully grown grass in a number of cells at once.
+        Args:
+            cells (array): Distinct flat cell indices, x * height + y.
+        Returns:
+            Boolean array, True for the cells where grass was eaten.
+        """
+        fully_grown = self.fully_grown.reshape(-1)
+        eaten = fully_grown[cells]
+        fully_grown[cells[eaten]] = False
+        return eaten
+
+    def is_fully_grown(self, pos):
+        """
+        Returns whether the grass at the given cell is fully grown.
+        Args:
+            pos (tuple): The coordinates of the cell.
+        """
+        x, y = pos
+        return bool(self.fully_grown[x, y])
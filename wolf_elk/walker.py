@@ -9,18 +9,52 @@ AUTHOR(S):   Karlijn Limpens
 DESCRIPTION: Walker class, with functions to move to certain kind so packs can
              be created in the ABM. Also, distance (steps to the point in the
              grid) can be measured to check the closest one and move in that
-             direction.
+             direction. Distances wrap around the edges of the torus.
+             All agents derive from CompactAgent, which provides the interface
+             of mesa.Agent using __slots__, so agents carry no per-instance
+             __dict__.
 """
 
-from mesa import Agent
-import heapq
-import random
 
+class CompactAgent():
+    """
+    Base class for the agents of the model, with the same interface as
+    mesa.Agent. The attributes of the agent are stored in __slots__, every
+    subclass lists the attributes it adds in its own __slots__.
+    """
+    __slots__ = ('unique_id', 'model', 'pos')
+
+    def __init__(self, unique_id: int, model: object, pos: tuple = None):
+        """
+        Args:
+            unique_id (int):         ID Generated by Mesa
+            model (mesa.Model):      Model-object
+            pos (tuple, optional):   Tuple with the coordinates
+        """
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = pos
+
+    def step(self):
+        """
+        A single step of the agent.
+        """
 
-class Walker(Agent):
+    def advance(self):
+        pass
+
+    @property
+    def random(self):
+        return self.model.random
+
+
+class Walker(CompactAgent):
     """
     Class with walker functions for all the agents.
     """
+    __slots__ = ()
+    # All agents use the same neighborhood, so it is stored on the class.
+    moore = True
 
     def __init__(
         self,
@@ -34,11 +68,16 @@ class Walker(Agent):
         x (int):                 The agent's current x coordinate
         y (int):                 The agent's current y coordinate
         moore (bool, optional):  If True, may move in all 8 directions.
-                                 Otherwise, only up, down, left, right.
+                                 Otherwise, only up, down, left, right. Must
+                                 be the same as the class attribute moore.
         """
-        super().__init__(unique_id, model)
-        self.pos = pos
-        self.moore = moore
+        if moore != self.moore:
+            raise ValueError(
+                "{} agents only support moore={}".format(
+                    type(self).__name__, self.moore
+                )
+            )
+        super().__init__(unique_id, model, pos)
 
     def random_move(self):
         """
@@ -84,43 +123,20 @@ class Walker(Agent):
                                               of agents, filtered based on
                                               criteria in the filter_func.
         """
-        # Get neighborhood first:
-        neighbours = self.model.grid.get_neighbors(
+        # Get agents of the type in the neighborhood from the grid index
+        agent_of_type = self.model.grid.get_breed_neighbors(
             self.pos,
-            moore=True,
-            include_center=False,
-            radius=radius
+            agent_type,
+            radius=radius,
+            include_center=False
         )
-        # Get closest neighbors
-        agent_of_type = [
-            agent for agent in neighbours if isinstance(agent, agent_type)
-        ]
         if (filter_func):
             agent_of_type = filter_func(agent_of_type)
         if agent_of_type:
-            agent_to_follow = self.__get_closest_agents(agent_of_type)
-            self.model.grid.move_agent(self, agent_to_follow[1].pos)
-            return agent_to_follow[1]
+            agent_to_follow = self.model.grid.get_closest_agent(
+                self.pos, agent_of_type
+            )
+            self.model.grid.move_agent(self, agent_to_follow.pos)
+            return agent_to_follow
         else:
             return None
-
-    def __get_closest_agents(self, agent_list: list):
-        """
-        Returns the closest agent.
-        Args:
-            agent_list (list): List of Agent objects.
-        Returns:
-            Closest agent in distance.
-        """
-        heap = []
-        [
-            heapq.heappush(
-                heap,
-                (
-                    (abs(self.pos[0] - agent.pos[0]),
-                     abs(self.pos[1] - agent.pos[1])),
-                    agent
-                )
-            ) for agent in agent_list
-        ]
-        return heapq.heappop(heap)
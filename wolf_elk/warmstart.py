@@ -0,0 +1,189 @@
+"""
+GROUP:       LIMPENS (9)
+DATE:        18 January 2021
+AUTHOR(S):   Karlijn Limpens
+             Joos Akkerman
+             Guido Vaessen
+             Stijn van den Berg
+             David Puroja
+DESCRIPTION: On-disk cache of burned-in model states. Runs with the same
+             parameters go through the same transient from their random
+             initial population. The cache keeps a few snapshots (see
+             WolfElk.checkpoint) of models which are already run for the
+             burn-in steps, and a new run starts from one of them with its own
+             random generators instead of from scratch:
+
+             <directory>/<key>/parameters.json   The parameters of the key.
+             <directory>/<key>/<slot>.snapshot  A burned-in state.
+
+             The key is a hash of all model parameters except the seed, and
+             the amount of burn-in steps. The states of a key are made with
+             seeds derived from the key, so a run with a given seed gives the
+             same result whether its state was cached or not. The total size
+             of the snapshots is limited, the least recently used snapshots
+             are evicted first.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .files import atomic_write
+from .model import WolfElk
+from .sweep import MODEL_DEFAULTS
+
+# Keyword arguments of WolfElk which do not change the state of a run.
+IGNORED_PARAMETERS = ('seed', 'debug')
+
+
+class WarmStartCache():
+    """
+    A directory of burned-in snapshots per parameter set, with a size limit
+    and LRU eviction.
+    """
+    def __init__(self, directory, burn_in=100, states_per_key=2,
+                 max_bytes=2**30):
+        """
+        Args:
+            directory         (str): The directory of the cache.
+            burn_in          (int, optional): The steps run before a state is
+                                              stored.
+            states_per_key   (int, optional): The distinct burned-in states
+                                              per parameter set. A run starts
+                                              from the state its seed selects.
+            max_bytes        (int, optional): The size limit of all snapshots
+                                              together.
+        """
+        if burn_in < 0:
+            raise ValueError("The burn-in can not be negative")
+        if states_per_key < 1:
+            raise ValueError("The cache needs at least one state per key")
+        self.directory = directory
+        self.burn_in = burn_in
+        self.states_per_key = states_per_key
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, params):
+        """
+        Returns the key of a parameter set: a hash of the burn-in steps and
+        all keyword arguments of WolfElk, defaults included.
+        Args:
+            params (dict): Keyword arguments for WolfElk.
+        """
+        settings = dict(MODEL_DEFAULTS, **params)
+        for name in IGNORED_PARAMETERS:
+            settings.pop(name, None)
+        settings['burn_in'] = self.burn_in
+        text = json.dumps(settings, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_model(self, params, seed=None):
+        """
+        Returns a model which is run for the burn-in steps, from the cache
+        when possible, with new random generators from the seed. Continue it
+        for the remaining steps of the run, e.g.
+        model.run_model(step_count - model.schedule.steps).
+        Args:
+            params (dict): Keyword arguments for WolfElk.
+            seed    (int, optional): Seed of the run, None for a random one.
+        Returns:
+            The burned-in WolfElk model.
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        key = self.key(params)
+        slot = int(np.random.default_rng(seed).integers(self.states_per_key))
+        path = os.path.join(self.directory, key, '{}.snapshot'.format(slot))
+
+        snapshot = self.read(path)
+        if snapshot is None:
+            snapshot = self.burn(params, key, slot)
+            self.write(path, params, snapshot)
+            self.evict(keep=path)
+        model = WolfElk.restore(snapshot)
+        model.reseed(seed)
+        return model
+
+    def burn(self, params, key, slot):
+        """
+        Runs a new model for the burn-in steps and returns its snapshot. The
+        seed of the model is derived from the key and the slot.
+        """
+        seed = WolfElk.spawn_seeds(int(key[:16], 16), self.states_per_key)
+        model = WolfElk(**params, seed=seed[slot])
+        while model.running and model.schedule.steps < self.burn_in:
+            model.step()
+        return model.checkpoint()
+
+    def read(self, path):
+        """
+        Returns a cached snapshot and marks it as used, or None when it is
+        not cached.
+        """
+        try:
+            with open(path, 'rb') as snapshot_file:
+                snapshot = snapshot_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Not cached yet, or evicted by another process.
+            return None
+        return snapshot
+
+    def write(self, path, params, snapshot):
+        """
+        Stores a snapshot, replacing an existing file atomically.
+        """
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'parameters.json'), 'w') as output:
+            json.dump(
+                dict(params, burn_in=self.burn_in), output, sort_keys=True,
+                default=repr
+            )
+        with atomic_write(path) as output:
+            output.write(snapshot)
+
+    def snapshots(self):
+        """
+        Returns the paths of all cached snapshots, least recently used
+        first, with their size and time of last use.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*', '*.snapshot')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        return [(path, size, used) for used, path, size in entries]
+
+    def size(self):
+        """
+        Returns the total size of the cached snapshots in bytes.
+        """
+        return sum(size for _, size, _ in self.snapshots())
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used snapshots until the cache is within
+        its size limit.
+        Args:
+            keep (str, optional): A snapshot which is not removed, e.g. the
+                                  one just written.
+        """
+        entries = self.snapshots()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -10,19 +10,18 @@ DESCRIPTION: This class contains two definitions for agents: Wolf-Agents and
              Pack-agents. A Wolf-agent moves freely as an individual in the
              model until it gets hungry: then it joins a Pack to attack an Elk.
 """
-from mesa import Agent
 from .walker import Walker
-from .agents import Elk
+from .trace import EventTrace
 
-import random
 import logging
-import numpy as np
 
 
 class Wolf(Walker):
     """
     A wolf that walks around, reproduces (asexually) and eats elk.
     """
+    __slots__ = ('energy', 'kills', 'pack')
+
     def __init__(self, unique_id, pos, model, moore, energy):
         """
         Create a Wolf.
@@ -69,16 +68,19 @@ class Wolf(Walker):
         """
         Step function for the Wolf-object.
         """
-        logging.debug("Wolf info ID: {}, PACK: {}, POS: {}".format(
-            self.unique_id, self.pack, self.pos)
-        )
+        if self.model.debug:
+            logging.debug(
+                "Wolf info ID: %s, PACK: %s, POS: %s",
+                self.unique_id, self.pack, self.pos
+            )
         if (self.pack):
             # If part of a pack, the pack controls the Wolf and the rest is
             # skipped. This should not happen and seeing this line indicates
             # an error in the model.
-            logging.debug("Wolf {} part of pack. Check scheduler for \
-                inconsistencies. A wolf is somewhere not correctly added or \
-                removed from the scheduler.".format(self))
+            if self.model.debug:
+                logging.debug("Wolf %s part of pack. Check scheduler for \
+                    inconsistencies. A wolf is somewhere not correctly added \
+                    or removed from the scheduler.", self)
             return
 
         self.random_move()
@@ -112,21 +114,25 @@ class Wolf(Walker):
                 self.model.grid.place_agent(pack, pack.pos)
                 pack.add_wolf_to_pack(agent)
                 pack.add_wolf_to_pack(self)
+                if self.model.trace is not None:
+                    self.model.trace.record(
+                        EventTrace.PACK_FORMED, pack.unique_id, pack.pos
+                    )
                 return
             else:
                 # See if there are Elks available
-                this_cell = self.model.grid.get_cell_list_contents([self.pos])
-                elk = [obj for obj in this_cell if isinstance(obj, Elk)]
+                elk_population = self.model.elk_population
+                elk = elk_population.in_cell(self.pos)
 
                 if len(elk) > 0:
-                    if (random.random() < self.model.wolf_lone_attack_prob):
+                    if self.random.random() < self.model.wolf_lone_attack_prob:
                         elk_to_eat = self.random.choice(elk)
                         self.energy += self.model.wolf_gain_from_food
 
                         # Kill the elk
                         self.kills += 1
-                        self.model.grid.remove_agent(elk_to_eat)
-                        self.model.schedule.remove(elk_to_eat)
+                        self.model.schedule.update_sum(self, 'kills', 1)
+                        elk_population.kill([elk_to_eat], [self])
 
         # Death or reproduction
         if self.energy < 0:
@@ -144,23 +150,22 @@ class Wolf(Walker):
                 )
                 self.model.grid.place_agent(cub, cub.pos)
                 self.model.schedule.add(cub)
+                if self.model.trace is not None:
+                    self.model.trace.record(
+                        EventTrace.WOLF_BORN, self.unique_id, self.pos,
+                        cub.unique_id
+                    )
 
     def death(self):
         """
         Removes a dead wolf from the model.
         """
-        logging.debug("Wolf died.")
+        if self.model.debug:
+            logging.debug("Wolf died.")
         self.pack = False
         self.model.grid.remove_agent(self)
         self.model.schedule.remove(self)
 
-    # Equality operators to overrule comparison in the heapq
-    def __eq__(self, other):
-        self.__class__ == other.__class__ and self.pos == other.pos
-
-    def __lt__(self, other):
-        return True
-
 
 class Pack(Walker):
     """
@@ -168,6 +173,8 @@ class Pack(Walker):
     when the pack is large enough and finds an Elk, it eats and the pack is
     disbanded.
     """
+    __slots__ = ('wolves', 'min_pack', 'late_wolves')
+
     def __init__(
         self,
         unique_id,
@@ -190,6 +197,9 @@ class Pack(Walker):
         super().__init__(unique_id, pos, model, moore=moore)
         self.wolves = wolves
         self.min_pack = pack_size_threshold
+        # Wolves which joined after the pack moved in this step, None when
+        # the pack has not moved yet.
+        self.late_wolves = None
         for wolf in wolves:
             self.add_wolf_to_pack(wolf)
 
@@ -197,46 +207,55 @@ class Pack(Walker):
         """
         Step function for the Pack.
         """
-        logging.debug("Wolf pack size {}".format(len(self.wolves)))
+        debug = self.model.debug
+        if debug:
+            logging.debug("Wolf pack size %s", len(self.wolves))
         if (len(self.wolves) < self.min_pack):
             self.find_wolf_for_pack()
-            logging.debug("Pack size below minimum")
+            if debug:
+                logging.debug("Pack size below minimum")
         else:
-            logging.debug("Pack up to size. Start searching for Elk.")
-            if (self.move_towards_specified_kind(
-                    Elk,
-                    self.model.wolf_territorium,
-                    self.choose_elk_to_eat)
-                    is None):
+            if debug:
+                logging.debug("Pack up to size. Start searching for Elk.")
+            # Move to an elk chosen by age, if there are any.
+            elk_in_radius = self.get_elk_in_radius(self.model.wolf_territorium)
+            if len(elk_in_radius) > 0:
+                target = self.choose_elk_to_eat(elk_in_radius)[0]
+                self.model.grid.move_agent(
+                    self, self.model.elk_population.position(target)
+                )
+            else:
                 # No elk found, move random.
                 self.random_move()
 
-        # Select elk to be eaten
-        elk_in_radius = self.get_elk_in_radius(self.model.wolf_territorium)
-        # Eat at most one elk per wolf, otherwise as much as available
-        number_elk_eaten = min(len(self.wolves), len(elk_in_radius))
-        chosen_elk_to_eat = self.choose_elk_to_eat(
-            elk_in_radius,
-            number_elk_eaten
-        )
-
-        if (
-            len(chosen_elk_to_eat) > 0 and
-            len(self.wolves) >= self.model.pack_size_threshold
-        ):
-            # Pack eats all chosen elk, pack is going to disband.
-            self.pack_has_eaten(chosen_elk_to_eat)
-            return
+        # The pack hunts, or otherwise spends energy, in the hunt phase of
+        # the model, together with all other packs.
+        self.late_wolves = []
+        self.model.hunting_packs.append(self)
 
+    def upkeep(self):
+        """
+        Upkeep of a pack which has not eaten in this step: every wolf loses
+        energy and dies or reproduces. Wolves which joined after the pack
+        moved already spent their energy of this step as lone wolves and are
+        skipped. A pack with less than two wolves left is disbanded.
+        """
+        debug = self.model.debug
+        late_wolves = self.late_wolves or ()
+        self.late_wolves = None
         for wolf in self.wolves:
+            if wolf in late_wolves:
+                continue
             wolf.energy -= 1
             if (wolf.energy < 0):
-                logging.debug("Wolf died while in pack")
+                if debug:
+                    logging.debug("Wolf died while in pack")
                 wolf.pack = False
                 self.wolves.remove(wolf)
                 continue
             if self.random.random() < self.model.wolf_reproduce:
-                logging.debug("Wolf born in pack")
+                if debug:
+                    logging.debug("Wolf born in pack")
                 wolf.energy /= 2
                 cub = Wolf(
                     self.model.next_id(),
@@ -247,9 +266,20 @@ class Pack(Walker):
                 )
                 cub.pack = True
                 self.wolves.append(cub)
-                logging.debug("Wolf born with ID: {}".format(cub.unique_id))
+                if debug:
+                    logging.debug("Wolf born with ID: %s", cub.unique_id)
+                if self.model.trace is not None:
+                    self.model.trace.record(
+                        EventTrace.WOLF_BORN, wolf.unique_id, self.pos,
+                        cub.unique_id
+                    )
         if (len(self.wolves) < 2):
-            logging.debug("Disbanding small pack")
+            if debug:
+                logging.debug("Disbanding small pack")
+            if self.model.trace is not None:
+                self.model.trace.record(
+                    EventTrace.PACK_DISBANDED, self.unique_id, self.pos
+                )
             for wolf in self.wolves:
                 self.remove_from_pack(wolf)
             self.model.grid.remove_agent(self)
@@ -286,8 +316,9 @@ class Pack(Walker):
             Wolf, self.model.wolf_territorium, self.filter_wolves
         )
         if (agent):
-            logging.debug("Next wolf found is: {}".format(agent))
-            logging.debug("Pack size is now {}".format(len(self.wolves)))
+            if self.model.debug:
+                logging.debug("Next wolf found is: %s", agent)
+                logging.debug("Pack size is now %s", len(self.wolves))
             self.add_wolf_to_pack(agent)
         else:
             self.find_pack_for_pack()
@@ -300,8 +331,9 @@ class Pack(Walker):
             Pack, self.model.wolf_territorium, self.filter_func_pack
         )
         if (pack):
-            logging.debug("Next pack found is: {}".format(pack))
-            logging.debug("Pack size is now {}".format(len(self.wolves)))
+            if self.model.debug:
+                logging.debug("Next pack found is: %s", pack)
+                logging.debug("Pack size is now %s", len(self.wolves))
             self.add_pack_to_pack(pack)
 
     def add_pack_to_pack(self, pack):
@@ -310,10 +342,16 @@ class Pack(Walker):
         Args:
             pack (Agent): Pack-object to merge with this pack.
         """
-        logging.debug("Merging packs")
         for wolf in pack.wolves:
             self.add_wolf_to_pack(wolf)
-        logging.debug("Pack is now {} wolves".format(len(self.wolves)))
+        if self.model.debug:
+            logging.debug("Merged packs, pack is now %s wolves",
+                          len(self.wolves))
+        if self.model.trace is not None:
+            self.model.trace.record(
+                EventTrace.PACK_MERGED, self.unique_id, self.pos,
+                pack.unique_id
+            )
         self.model.schedule.remove(pack)
         self.model.grid.remove_agent(pack)
 
@@ -323,13 +361,16 @@ class Pack(Walker):
         Args:
             wolf (Agent): The Wolf-object to add to the pack.
         """
-        logging.debug("Adding wolf {} to pack".format(wolf.unique_id))
+        if self.model.debug:
+            logging.debug("Adding wolf %s to pack", wolf.unique_id)
         # When a Wolf is part of a pack
         if (not wolf.pack):
             self.model.schedule.remove(wolf)
             self.model.grid.remove_agent(wolf)
         wolf.pack = True
         self.wolves.append(wolf)
+        if self.late_wolves is not None:
+            self.late_wolves.append(wolf)
 
     def remove_from_pack(self, wolf):
         """
@@ -337,10 +378,11 @@ class Pack(Walker):
         Args:
             wolf (Agent): The Wolf agent to remove from the pack.
         """
-        logging.debug("Removing Wolf")
-        logging.debug("Wolf info ID: {}, PACK: {}, POS: {}".format(
-            wolf.unique_id, wolf.pack, wolf.pos)
-        )
+        if self.model.debug:
+            logging.debug(
+                "Removing Wolf ID: %s, PACK: %s, POS: %s",
+                wolf.unique_id, wolf.pack, wolf.pos
+            )
         wolf.pack = False
         self.model.schedule.add(wolf)
         self.model.grid.place_agent(wolf, self.pos)
@@ -354,18 +396,11 @@ class Pack(Walker):
         Returns:
             List of elk Agent objects.
         """
-        agents_in_radius = self.model.grid.get_neighbors(
+        return self.model.elk_population.in_radius(
             self.pos,
-            moore=True,
-            include_center=False,
-            radius=radius
+            radius,
+            include_center=False
         )
-        # Get closest elks
-        elk_in_radius = [
-            agent for agent in agents_in_radius if isinstance(agent, Elk)
-        ]
-
-        return elk_in_radius
 
     def choose_elk_to_eat(self, elk, number=1):
         """
@@ -379,35 +414,36 @@ class Pack(Walker):
         if len(elk) == 0:
             return []
 
-        def prob_killedbywolf_byage(age):
-            param = self.model.elk_wolfkill_params
-            degree = self.model.polynomial_degree
-            return max(
-                0.001, sum([param[i]*age**(degree-i) for i in range(degree+1)])
-            )
-
         # compute absolute and relative probabilities
-        P_per_elk = [prob_killedbywolf_byage(ind_elk.age) for ind_elk in elk]
-        P_all_elk = [P_elk/sum(P_per_elk) for P_elk in P_per_elk]
+        P_per_elk = self.model.elk_wolfkill_table.values(
+            self.model.elk_population.ages(elk)
+        )
+        P_all_elk = P_per_elk / P_per_elk.sum()
 
         # control for rounding errors to have a total probability of 1
-        P_all_elk[0] += 1-sum(P_all_elk)
+        P_all_elk[0] += 1-P_all_elk.sum()
 
-        return np.random.choice(elk, p=P_all_elk, replace=False, size=number)
+        chosen = self.model.rng.choice(
+            len(elk), p=P_all_elk, replace=False, size=number
+        )
+        return [elk[i] for i in chosen]
 
     def pack_has_eaten(self, elk_to_eat):
         """
         Pack has eaten. Add kills to wolf, add energy and disband the pack.
+        The elk themselves are killed by the hunt phase of the model.
         Args:
-            elk_to_eat (Agent): The Elk-agent to eat.
-        """
-        # Remove elk
-        for elk in elk_to_eat:
-            self.model.grid.remove_agent(elk)
-            self.model.schedule.remove(elk)
-        logging.debug('Pack has eated, disbanding pack with size {}'.format(
-            len(self.wolves))
-        )
+            elk_to_eat (list): The elk eaten by the pack.
+        """
+        if self.model.debug:
+            logging.debug(
+                'Pack has eaten, disbanding pack with size %s',
+                len(self.wolves)
+            )
+        if self.model.trace is not None:
+            self.model.trace.record(
+                EventTrace.PACK_DISBANDED, self.unique_id, self.pos
+            )
         for wolf in self.wolves:
             wolf.energy += self.model.wolf_gain_from_food*len(elk_to_eat)
             wolf.kills += 1
@@ -416,12 +452,5 @@ class Pack(Walker):
         self.model.grid.remove_agent(self)
         self.model.schedule.remove(self)
 
-    # Equality operators to overrule comparison in the heapq.
-    def __eq__(self, other):
-        self.__class__ == other.__class__ and self.pos == other.pos
-
-    def __lt__(self, other):
-        return True
-
     def __len__(self):
         return len(self.wolves)